@@ -0,0 +1,425 @@
+import argparse
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+import requests
+import gspread
+from gspread.utils import a1_to_rowcol
+
+import urlui
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# --- Defaults ---
+BENCH_URLS = 8
+BENCH_ROWS = 5000
+BENCH_FORMAT = 'csv'
+BENCH_SERVER_LATENCY = 0.05  # Seconds added to every fake BSE response
+BENCH_SHEETS_LATENCY = 0.02  # Seconds added to every fake Sheets call
+BENCH_SHEETS_QUOTA_PER_MINUTE = 60  # Fake Sheets write quota; calls beyond it get a 429
+BENCH_SHEET_ID = 'BENCHMARK_SHEET'
+
+# === Synthetic Disclosures ===
+SECURITIES = [(500325, "RELIANCE INDUSTRIES LTD"), (500209, "INFOSYS LTD"), (500570, "TATA MOTORS LTD"),
+              (500180, "HDFC BANK LTD"), (500875, "ITC LTD"), (532540, "TATA CONSULTANCY SERVICES LTD")]
+
+def synthetic_disclosures(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(SECURITIES), rows)
+    acquired_on = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 300, rows), unit="D")
+    return pd.DataFrame({
+        "Security Code": [SECURITIES[i][0] for i in picks],
+        "Security Name": [SECURITIES[i][1] for i in picks],
+        "Name of Person": [f"Person {n % 997}" for n in range(seed * rows, (seed + 1) * rows)],
+        "Category of person": rng.choice(["Promoter", "Promoter Group", "Director", "Designated Person"], rows),
+        "Type of Securities (Prior)": "Equity Shares",
+        "Number of Securities (Prior)": [f"{v:,}" for v in rng.integers(0, 10**7, rows)],
+        "% Shareholding (Prior)": rng.random(rows).round(2),
+        "Number of Securities (Acquired/Disposed)": rng.integers(1, 10**5, rows),
+        "Value of Securities (Acquired/Disposed)": rng.integers(1, 10**8, rows),
+        "Transaction Type": rng.choice(["Buy", "Sell", "Pledge"], rows),
+        "Date of allotment/acquisition From": acquired_on.strftime("%d/%m/%Y"),
+        "Date of Intimation to Company": (acquired_on + pd.Timedelta(days=2)).strftime("%d/%m/%Y"),
+        "Mode of Acquisition": rng.choice(["Market Purchase", "Market Sale", "Off Market", "ESOP"], rows),
+        "Exchange": rng.choice(["BSE", "NSE"], rows),
+        "Reported to Exchange": (acquired_on + pd.Timedelta(days=3)).strftime("%d/%m/%Y"),
+    })
+
+def export_bytes(df, file_format):
+    if file_format == 'xlsx':
+        buffer = io.BytesIO()
+        df.to_excel(buffer, index=False)
+        return buffer.getvalue()
+    return df.to_csv(index=False).encode("utf-8")
+
+# === Fake BSE Server ===
+DISCLOSURE_PAGE = """<html><head><title>Insider Trading Disclosures</title></head><body>
+<form name="aspnetForm" method="post" action="./disclosures.aspx" id="aspnetForm">
+<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{viewstate}" />
+<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="bench" />
+<a id="{link_id}" href="javascript:__doPostBack(&#39;ctl00$ContentPlaceHolder1${link_id}&#39;,&#39;&#39;)">Download</a>
+</form></body></html>"""
+
+EXPORT_TYPES = {
+    'csv': ("InsiderTrading.csv", "text/csv"),
+    'xlsx': ("InsiderTrading.xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+}
+
+class FakeBseServer:
+    # Serves a disclosures page per ?source=N and answers its __doPostBack with that source's export.
+    def __init__(self, sources, rows, file_format=BENCH_FORMAT, latency=BENCH_SERVER_LATENCY):
+        self.file_format = file_format
+        self.latency = latency
+        self.requests = {"GET": 0, "POST": 0}
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self.payloads = [export_bytes(synthetic_disclosures(rows, seed), file_format) for seed in range(sources)]
+        self._server = None
+
+    def start(self):
+        bench_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _source(self):
+                values = parse_qs(urlparse(self.path).query).get("source", ["0"])
+                return int(values[0]) % len(bench_server.payloads)
+
+            def _send(self, body, content_type, file_name=None):
+                time.sleep(bench_server.latency)
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                if file_name:
+                    self.send_header("Content-Disposition", f'attachment; filename="{file_name}"')
+                self.end_headers()
+                self.wfile.write(body)
+                with bench_server._lock:
+                    bench_server.bytes_sent += len(body)
+
+            def do_GET(self):
+                with bench_server._lock:
+                    bench_server.requests["GET"] += 1
+                page = DISCLOSURE_PAGE.format(viewstate=f"state{self._source()}", link_id=urlui.DOWNLOAD_LINK_ID)
+                self._send(page.encode("utf-8"), "text/html; charset=utf-8")
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with bench_server._lock:
+                    bench_server.requests["POST"] += 1
+                file_name, content_type = EXPORT_TYPES[bench_server.file_format]
+                self._send(bench_server.payloads[self._source()], content_type, file_name)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, name="fake-bse", daemon=True).start()
+        return self
+
+    def url_for(self, source):
+        # The page's form posts back to ./disclosures.aspx, so the source has to survive as a query string.
+        return f"http://127.0.0.1:{self._server.server_address[1]}/disclosures.aspx?source={source}"
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+# === Fake Google Sheets Backend ===
+class FakeSheetsBackend:
+    # Records every call the tool makes and enforces a per-minute write quota like the real API.
+    def __init__(self, latency=BENCH_SHEETS_LATENCY, writes_per_minute=BENCH_SHEETS_QUOTA_PER_MINUTE):
+        self.latency = latency
+        self.writes_per_minute = writes_per_minute
+        self.calls = {}
+        self.cells_written = 0
+        self.throttled = 0
+        self._write_times = []
+        self._lock = threading.Lock()
+        self.spreadsheets = {}
+
+    def call(self, name, write=True, cells=0):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if write and self.writes_per_minute:
+                now = time.monotonic()
+                self._write_times = [t for t in self._write_times if now - t < 60]
+                if len(self._write_times) >= self.writes_per_minute:
+                    self.throttled += 1
+                    raise _quota_error()
+                self._write_times.append(now)
+            self.cells_written += cells
+
+    def snapshot(self):
+        with self._lock:
+            return {"calls": dict(self.calls), "total_calls": sum(self.calls.values()),
+                    "cells_written": self.cells_written, "throttled": self.throttled}
+
+def _quota_error():
+    response = requests.Response()
+    response.status_code = 429
+    response._content = json.dumps({"error": {"code": 429, "status": "RESOURCE_EXHAUSTED",
+                                              "message": "Quota exceeded for 'Write requests per minute per user'."}}).encode("utf-8")
+    return gspread.exceptions.APIError(response)
+
+class FakeWorksheet:
+    def __init__(self, backend, worksheet_id, title, rows, cols):
+        self.backend = backend
+        self.id = worksheet_id
+        self.title = title
+        self.row_count = rows
+        self.col_count = cols
+        self.data = []
+
+    def _put(self, first_row, first_col, values):
+        for offset, row in enumerate(values):
+            while len(self.data) < first_row + offset:
+                self.data.append([])
+            line = self.data[first_row + offset - 1]
+            while len(line) < first_col - 1 + len(row):
+                line.append("")
+            for position, value in enumerate(row):
+                line[first_col - 1 + position] = "" if value is None else str(value)
+
+    def get_all_values(self, **kwargs):
+        self.backend.call("get_all_values", write=False)
+        return [list(row) for row in self.data]
+
+    def clear(self):
+        self.backend.call("clear")
+        self.data = []
+
+    def resize(self, rows=None, cols=None):
+        self.backend.call("resize")
+        self.row_count = rows or self.row_count
+        self.col_count = cols or self.col_count
+
+    def update(self, values=None, range_name=None, **kwargs):
+        if isinstance(values, str):
+            values, range_name = range_name, values
+        self.backend.call("update", cells=sum(len(row) for row in values))
+        self._put(*a1_to_rowcol((range_name or "A1").split(":")[0]), values)
+
+    def batch_update(self, data, **kwargs):
+        self.backend.call("batch_update", cells=sum(len(row) for item in data for row in item["values"]))
+        for item in data:
+            self._put(*a1_to_rowcol(item["range"].split(":")[0]), item["values"])
+
+    def append_rows(self, values, **kwargs):
+        self.backend.call("append_rows", cells=sum(len(row) for row in values))
+        self._put(len(self.data) + 1, 1, values)
+
+class FakeSpreadsheet:
+    def __init__(self, backend, key):
+        self.backend = backend
+        self.id = key
+        self.url = f"https://docs.google.com/spreadsheets/d/{key}"
+        self.worksheets = {}
+
+    def worksheet(self, title):
+        self.backend.call("worksheet", write=False)
+        if title not in self.worksheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self.worksheets[title]
+
+    def add_worksheet(self, title, rows, cols):
+        self.backend.call("add_worksheet")
+        self.worksheets[title] = FakeWorksheet(self.backend, len(self.worksheets) + 1, title, rows, cols)
+        return self.worksheets[title]
+
+class FakeGspreadClient:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def open_by_key(self, key):
+        self.backend.call("open_by_key", write=False)
+        return self.backend.spreadsheets.setdefault(key, FakeSpreadsheet(self.backend, key))
+
+# === Measurements ===
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def span_summary(trace_path):
+    durations = {}
+    if os.path.exists(trace_path):
+        with open(trace_path, encoding="utf-8") as f:
+            for line in f:
+                span = json.loads(line)
+                durations.setdefault(span["name"], []).append(span["duration_ms"] / 1000)
+    return {name: {"count": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95),
+                   "max": max(values), "total": sum(values)}
+            for name, values in sorted(durations.items())}
+
+# === Benchmark Run ===
+def configure_urlui(workdir, backend, args):
+    urlui.GOOGLE_SHEET_ID = BENCH_SHEET_ID
+    urlui.get_gspread_client = lambda: FakeGspreadClient(backend)
+    urlui.ARCHIVE_ENABLED = not args.no_archive
+    urlui.ARCHIVE_DIR = os.path.join(workdir, "archive")
+    urlui.SYNC_STATE_FILE = os.path.join(workdir, "sync_state.json")
+    urlui.SHEET_SYNC_MODE = args.sync_mode
+    urlui.USE_DIRECT_HTTP_DOWNLOAD = not args.browser
+    urlui.METRICS_FILE = None
+    if args.sheets_rpm:
+        urlui.sheets_write_limiter = urlui.RateLimiter(args.sheets_rpm, 60)
+
+def run_benchmark(args):
+    workdir = tempfile.mkdtemp(prefix="urlui-bench-")
+    backend = FakeSheetsBackend(args.sheets_latency, args.sheets_quota)
+    print(f"Benchmark: Generating {args.urls} synthetic {args.format.upper()} export(s) of {args.rows:,} rows...")
+    server = FakeBseServer(args.urls, args.rows, args.format, args.server_latency).start()
+    configure_urlui(workdir, backend, args)
+    entries = [{"url": server.url_for(source), "sheet_id": None, "worksheet": f"bench_{source}"} for source in range(args.urls)]
+    log_path = os.path.join(workdir, "run.log")
+    rss_baseline = peak_rss_bytes()
+    report = {"config": {key: value for key, value in vars(args).items() if key not in ("json", "compare", "keep")},
+              "runs": [], "rss_baseline_bytes": rss_baseline}
+    try:
+        with open(log_path, "a", encoding="utf-8") as log_file:
+            log_sink = urlui.ConsoleLogSink() if args.verbose else urlui.ConsoleLogSink(log_file)
+            for run_number in range(1, args.repeat + 1):
+                urlui.TRACE_FILE = os.path.join(workdir, f"traces-{run_number}.jsonl")
+                urlui.metrics = urlui.MetricsRegistry()
+                calls_before = backend.snapshot()
+                started = time.perf_counter()
+                with log_sink.channel("benchmark"):
+                    outcomes = urlui.run_batch(entries, os.path.join(workdir, "downloads"), args.download_workers, args.timeout, 0,
+                                               log_sink, args.parse_workers, args.upload_workers, args.parse_processes)
+                elapsed = time.perf_counter() - started
+                calls_after = backend.snapshot()
+                succeeded = sum(1 for outcome in outcomes if outcome["ok"])
+                latencies = [outcome["elapsed"] for outcome in outcomes]
+                report["runs"].append({
+                    "run": run_number,
+                    "seconds": elapsed,
+                    "succeeded": succeeded,
+                    "skipped": sum(1 for outcome in outcomes if outcome.get("skipped")),
+                    "urls_per_minute": len(entries) / elapsed * 60 if elapsed > 0 else None,
+                    "rows_per_second": sum(outcome["rows"] or 0 for outcome in outcomes) / elapsed if elapsed > 0 else None,
+                    "url_latency": {"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95), "max": max(latencies)},
+                    "steps": span_summary(urlui.TRACE_FILE),
+                    "sheets_calls": {name: count - calls_before["calls"].get(name, 0) for name, count in calls_after["calls"].items()
+                                     if count - calls_before["calls"].get(name, 0)},
+                    "sheets_calls_total": calls_after["total_calls"] - calls_before["total_calls"],
+                    "sheets_cells_written": calls_after["cells_written"] - calls_before["cells_written"],
+                    "sheets_throttled": calls_after["throttled"] - calls_before["throttled"],
+                    "sheets_retries": sum(urlui.metrics.value("urlui_sheets_api_retries_total", status=status)
+                                          for status in (429, 500, 502, 503, 504, "connection")),
+                    "bytes_downloaded": sum(urlui.metrics.value("urlui_download_bytes_total", method=method) for method in ("direct", "browser", "stream")),
+                    "errors": sorted({outcome["error"] for outcome in outcomes if outcome["error"]}),
+                })
+        report["rss_peak_bytes"] = peak_rss_bytes()
+        report["fake_bse_requests"] = dict(server.requests)
+    finally:
+        server.stop()
+        urlui.get_webdriver_pool().close()
+        if args.keep:
+            print(f"Benchmark: Working files kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+# === Reporting ===
+def _ms(seconds):
+    return f"{seconds * 1000:9.1f}" if seconds is not None else f"{'-':>9}"
+
+def _mb(size_bytes):
+    return f"{size_bytes / 1024 / 1024:.1f} MB" if size_bytes is not None else "n/a"
+
+def print_report(report):
+    config = report["config"]
+    print(f"=== Benchmark: {config['urls']} URL(s) x {config['rows']:,} rows ({config['format']}), "
+          f"download/parse/upload workers {config['download_workers']}/{config['parse_workers']}/{config['upload_workers']}, "
+          f"sync mode {config['sync_mode']} ===")
+    for run in report["runs"]:
+        print(f"Run {run['run']}: {run['succeeded']}/{config['urls']} ok ({run['skipped']} unchanged) in {run['seconds']:.2f}s"
+              f" | {run['urls_per_minute']:.1f} URLs/min | {run['rows_per_second']:,.0f} rows/s"
+              f" | per URL p50 {run['url_latency']['p50']:.2f}s, p95 {run['url_latency']['p95']:.2f}s")
+        print(f"  {'step':<28}{'count':>6}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'total s':>10}")
+        for name, step in run["steps"].items():
+            print(f"  {name:<28}{step['count']:>6}{_ms(step['p50'])} {_ms(step['p95'])} {_ms(step['max'])}{step['total']:>10.2f}")
+        calls = ", ".join(f"{name} {count}" for name, count in sorted(run["sheets_calls"].items()))
+        print(f"  Sheets API: {run['sheets_calls_total']} call(s) ({calls or 'none'}), {run['sheets_cells_written']:,} cells, "
+              f"{run['sheets_throttled']} throttled (429), {run['sheets_retries']} retried")
+        print(f"  Downloaded: {run['bytes_downloaded']:,} bytes")
+        for error in run["errors"]:
+            print(f"  Error: {error}")
+    print(f"Peak RSS: {_mb(report.get('rss_peak_bytes'))} (before the runs: {_mb(report.get('rss_baseline_bytes'))})")
+
+def print_comparison(report, baseline):
+    def first_run_value(data, key):
+        return data["runs"][0][key] if data.get("runs") else None
+
+    rows = [("seconds (run 1)", first_run_value(baseline, "seconds"), first_run_value(report, "seconds")),
+            ("URLs/min (run 1)", first_run_value(baseline, "urls_per_minute"), first_run_value(report, "urls_per_minute")),
+            ("Sheets calls (run 1)", first_run_value(baseline, "sheets_calls_total"), first_run_value(report, "sheets_calls_total")),
+            ("peak RSS MB", (baseline.get("rss_peak_bytes") or 0) / 1024 / 1024, (report.get("rss_peak_bytes") or 0) / 1024 / 1024)]
+    print("=== Compared with baseline ===")
+    for label, before, after in rows:
+        if before is None or after is None:
+            continue
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"  {label:<22}{before:>12.2f}{after:>12.2f}{change:>10}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the download/parse/upload pipeline offline against a fake BSE site and a fake Google Sheets backend.")
+    parser.add_argument("--urls", type=int, default=BENCH_URLS, help="Number of distinct disclosure URLs.")
+    parser.add_argument("--rows", type=int, default=BENCH_ROWS, help="Rows per synthetic export.")
+    parser.add_argument("--format", choices=sorted(EXPORT_TYPES), default=BENCH_FORMAT, help="Export file format.")
+    parser.add_argument("--repeat", type=int, default=2, help="Run the same batch this many times (later runs exercise the unchanged-download skip).")
+    parser.add_argument("--download-workers", type=int, default=urlui.PIPELINE_DOWNLOAD_WORKERS)
+    parser.add_argument("--parse-workers", type=int, default=urlui.PIPELINE_PARSE_WORKERS)
+    parser.add_argument("--upload-workers", type=int, default=urlui.PIPELINE_UPLOAD_WORKERS)
+    parser.add_argument("--parse-processes", type=int, default=urlui.PIPELINE_PARSE_PROCESSES)
+    parser.add_argument("--sync-mode", choices=["incremental", "full"], default=urlui.sheet_sync_mode())
+    parser.add_argument("--timeout", type=float, default=urlui.BATCH_TASK_TIMEOUT, help="Seconds per URL before it counts as failed.")
+    parser.add_argument("--server-latency", type=float, default=BENCH_SERVER_LATENCY, help="Seconds added to every fake BSE response.")
+    parser.add_argument("--sheets-latency", type=float, default=BENCH_SHEETS_LATENCY, help="Seconds added to every fake Sheets call.")
+    parser.add_argument("--sheets-quota", type=int, default=BENCH_SHEETS_QUOTA_PER_MINUTE, help="Fake Sheets writes per minute before 429s (0 = unlimited).")
+    parser.add_argument("--sheets-rpm", type=int, help="Override the tool's own Sheets write rate limit (requests per minute).")
+    parser.add_argument("--no-archive", action="store_true", help="Skip the local Parquet archive.")
+    parser.add_argument("--browser", action="store_true", help="Download through Chrome instead of the direct HTTP path.")
+    parser.add_argument("--json", metavar="FILE", help="Also write the report as JSON (e.g. to compare against later).")
+    parser.add_argument("--compare", metavar="FILE", help="Print the change against a report written earlier with --json.")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary working directory (downloads, traces, run.log).")
+    parser.add_argument("--verbose", action="store_true", help="Show the tool's own log lines.")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    bench_args = parse_args()
+    bench_report = run_benchmark(bench_args)
+    print_report(bench_report)
+    if bench_args.json:
+        with open(bench_args.json, "w", encoding="utf-8") as f:
+            json.dump(bench_report, f, indent=2, default=str)
+        print(f"Benchmark: Report written to {bench_args.json}")
+    if bench_args.compare:
+        with open(bench_args.compare, encoding="utf-8") as f:
+            print_comparison(bench_report, json.load(f))
+    sys.exit(0 if all(run["succeeded"] == bench_args.urls for run in bench_report["runs"]) else 1)
@@ -0,0 +1,130 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+import pytest
+
+import urlui
+
+POSTBACK_PAGE = """<html><body>
+<form name="aspnetForm" method="post" action="./disclosures.aspx?flag=1" id="aspnetForm">
+  <input type="hidden" name="__EVENTTARGET" value="" />
+  <input type="hidden" name="__VIEWSTATE" value="state123" />
+  <input type="text" name="txtFrom" value="01/01/2024" />
+  <input type="checkbox" name="chkAll" />
+  <input type="checkbox" name="chkSome" checked />
+  <input type="submit" name="btnSubmit" value="Go" />
+  <select name="ddlType"><option value="a">A</option><option value="b" selected>B</option></select>
+  <a id="downloadlnk" href="javascript:__doPostBack(&#39;ctl00$Content$downloadlnk&#39;,&#39;&#39;)">Download</a>
+</form></body></html>"""
+
+CSV_BODY = b"Security Code,Security Name\n500325,RELIANCE INDUSTRIES LTD\n"
+
+
+def test_resolve_postback_link_posts_form_fields_and_event_target():
+    target = urlui.resolve_download_target("https://www.bseindia.com/corporates/disclosures.aspx", POSTBACK_PAGE)
+    assert target["method"] == "POST"
+    assert target["url"] == "https://www.bseindia.com/corporates/disclosures.aspx?flag=1"
+    data = dict(target["data"])
+    assert data["__VIEWSTATE"] == "state123"
+    assert data["txtFrom"] == "01/01/2024"
+    assert data["ddlType"] == "b"
+    assert "chkSome" in data
+    assert "chkAll" not in data
+    assert "btnSubmit" not in data
+    assert data["__EVENTTARGET"] == "ctl00$Content$downloadlnk"
+    assert data["__EVENTARGUMENT"] == ""
+    assert [name for name, _ in target["data"]].count("__EVENTTARGET") == 1
+
+
+def test_resolve_plain_link_is_a_get():
+    html = '<a id="downloadlnk" href="/files/export.csv">Download</a>'
+    target = urlui.resolve_download_target("https://example.com/page/", html)
+    assert target == {"method": "GET", "url": "https://example.com/files/export.csv", "data": None}
+
+
+def test_resolve_submit_input_posts_its_own_name():
+    html = ('<form action="export"><input type="hidden" name="k" value="v" />'
+            '<input type="submit" id="downloadlnk" name="btnDownload" value="Download" /></form>')
+    target = urlui.resolve_download_target("https://example.com/page/", html)
+    assert target["method"] == "POST"
+    assert target["url"] == "https://example.com/page/export"
+    assert target["data"] == [("k", "v"), ("btnDownload", "Download")]
+
+
+def test_resolve_missing_link_returns_none():
+    assert urlui.resolve_download_target("https://example.com/", "<html><a id='other'>x</a></html>") is None
+
+
+@pytest.fixture
+def bse_server():
+    state = {"export": CSV_BODY, "content_type": "text/csv", "posts": []}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, body, content_type, extra_headers=()):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in extra_headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._send(POSTBACK_PAGE.encode("utf-8"), "text/html")
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+            state["posts"].append({"path": self.path, "form": dict(parse_qsl(body, keep_blank_values=True)),
+                                   "referer": self.headers.get("Referer")})
+            self._send(state["export"], state["content_type"], [("Content-Disposition", 'attachment; filename="InsiderTrading.csv"')])
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state["url"] = f"http://127.0.0.1:{server.server_address[1]}/corporates/disclosures.aspx"
+    yield state
+    server.shutdown()
+    server.server_close()
+    with urlui._download_target_cache_lock:
+        urlui._download_target_cache.clear()
+
+
+def test_request_export_follows_the_postback(bse_server):
+    response = urlui.request_export(bse_server["url"])
+    with response:
+        assert response.content == CSV_BODY
+    post = bse_server["posts"][0]
+    assert post["path"] == "/corporates/disclosures.aspx?flag=1"
+    assert post["form"]["__EVENTTARGET"] == "ctl00$Content$downloadlnk"
+    assert post["form"]["__VIEWSTATE"] == "state123"
+    assert post["referer"] == bse_server["url"]
+
+
+def test_direct_http_download_saves_the_export(bse_server, tmp_path):
+    file_path = urlui.direct_http_download(bse_server["url"], str(tmp_path))
+    assert file_path == str(tmp_path / "InsiderTrading.csv")
+    with open(file_path, "rb") as f:
+        assert f.read() == CSV_BODY
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["InsiderTrading.csv"]
+
+
+def test_direct_http_download_rejects_html_and_leaves_no_partial_file(bse_server, tmp_path):
+    bse_server["export"] = b"<!DOCTYPE html><html><body>Session expired</body></html>"
+    bse_server["content_type"] = "text/html"
+    assert urlui.direct_http_download(bse_server["url"], str(tmp_path)) is None
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_write_chunks_to_file_removes_part_file_on_failure(tmp_path):
+    def chunks():
+        yield b"more"
+        raise ConnectionError("connection reset")
+
+    with pytest.raises(ConnectionError):
+        urlui.write_chunks_to_file(str(tmp_path / "export.csv"), b"first", chunks())
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,100 @@
+import io
+import threading
+import time
+
+import urlui
+
+
+class FakePage:
+    def __init__(self):
+        self.session_id = "session"
+
+    def call_soon_threadsafe(self, func):
+        func()
+
+
+class FakeLabel:
+    def __init__(self):
+        self.value = ""
+        self.updates = 0
+
+    def update(self):
+        self.updates += 1
+
+
+def make_sink(max_lines=30, flush_interval_ms=10_000):
+    label = FakeLabel()
+    return urlui.StatusLogSink(FakePage(), label, max_lines=max_lines, flush_interval_ms=flush_interval_ms), label
+
+
+def test_status_sink_keeps_only_the_last_lines():
+    sink, label = make_sink(max_lines=3)
+    sink.append("one\ntwo\nthree")
+    sink.append("four\n\nfive")
+    sink.flush()
+    assert label.value == "three\nfour\nfive"
+
+
+def test_status_sink_coalesces_appends_into_one_update():
+    sink, label = make_sink(flush_interval_ms=20)
+    for i in range(50):
+        sink.append(f"line {i}")
+    assert label.updates == 0
+    deadline = time.time() + 2
+    while label.updates == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    assert label.updates == 1
+    assert label.value.splitlines()[-1] == "line 49"
+
+
+def test_status_sink_flush_without_new_lines_does_not_update():
+    sink, label = make_sink()
+    sink.append("hello")
+    sink.flush()
+    sink.flush()
+    assert label.updates == 1
+
+
+def test_status_sink_prefixes_channel_and_drops_blank_lines():
+    sink, label = make_sink()
+    sink.append("first\n   \nsecond", channel="#2")
+    sink.flush()
+    assert label.value == "[#2] first\n[#2] second"
+
+
+def test_status_sink_set_text_replaces_buffer():
+    sink, label = make_sink()
+    sink.append("old")
+    sink.set_text("new\ntext")
+    assert label.value == "new\ntext"
+
+
+def test_status_sink_falls_back_to_stdout_when_page_is_gone(capfd):
+    sink, label = make_sink()
+    sink.page.session_id = None
+    sink.append("orphaned")
+    assert "(UI Page Gone) orphaned" in capfd.readouterr().out
+    assert label.updates == 0
+
+
+def test_channels_route_each_threads_prints_to_its_own_prefix():
+    stream = io.StringIO()
+    sink = urlui.ConsoleLogSink(stream)
+
+    def worker(name):
+        with sink.channel(name):
+            for i in range(20):
+                print(f"{name} step {i}")
+
+    threads = [threading.Thread(target=worker, args=(f"t{n}",)) for n in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 60
+    for line in lines:
+        prefix, _, text = line.partition(" ")
+        assert prefix == f"[{text.split()[0]}]"
@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+import urlui
+
+
+@pytest.fixture
+def late_latin1_csv(tmp_path):
+    rows = ["Security Code,Name of Person,Security Name"] + [f"{i},Person A,RELIANCE" for i in range(5000)]
+    path = tmp_path / "export.csv"
+    path.write_bytes(("\n".join(rows) + "\n").encode("utf-8") + "9,Caf\xe9,RELIANCE\n".encode("latin1"))
+    return str(path)
+
+
+@pytest.mark.parametrize("pyarrow", [True, False])
+def test_late_non_utf8_byte_falls_back_to_latin1(late_latin1_csv, monkeypatch, pyarrow):
+    if not pyarrow:
+        monkeypatch.setattr(urlui, "_module_available", lambda name: False)
+    df = urlui.read_disclosure_file(late_latin1_csv)
+    assert df.shape == (5001, 3)
+    assert df["Name of Person"].iloc[0] == "Person A"
+    assert df["Name of Person"].iloc[-1] == "Caf\xe9"
+    assert df.attrs["parse_stats"]["engine"].endswith("latin1")
+
+
+def test_late_non_utf8_byte_falls_back_to_latin1_when_chunked(late_latin1_csv, monkeypatch):
+    monkeypatch.setattr(urlui, "PARSE_CHUNKED_THRESHOLD_BYTES", 0)
+    monkeypatch.setattr(urlui, "PARSE_CSV_CHUNK_ROWS", 1000)
+    df = urlui.read_disclosure_file(late_latin1_csv)
+    assert df["Name of Person"].iloc[-1] == "Caf\xe9"
+    assert df.attrs["parse_stats"]["engine"] == "c/chunked, latin1"
+
+
+@pytest.fixture
+def odd_values_csv(tmp_path):
+    rows = ["Security Code,Name of Person,Value,Date of Allotment,Number of Securities"]
+    rows += [f'{i},P,"1,000",2024-03-09,5' for i in range(3000)]
+    rows += ["9,Q,12.5%,09-Mar-2024 10:15,-"]
+    path = tmp_path / "export.csv"
+    path.write_text("\n".join(rows) + "\n")
+    return str(path)
+
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_values_the_schema_cannot_read_keep_the_column_as_text(odd_values_csv, monkeypatch, capsys, chunked):
+    if chunked:
+        monkeypatch.setattr(urlui, "PARSE_CHUNKED_THRESHOLD_BYTES", 0)
+        monkeypatch.setattr(urlui, "PARSE_CSV_CHUNK_ROWS", 1000)
+    df = urlui.read_disclosure_file(odd_values_csv)
+    assert df.iloc[-1].tolist()[1:] == ["Q", "12.5%", "09-Mar-2024 10:15", "-"]
+    assert df.iloc[0].tolist()[1:] == ["P", "1,000", "2024-03-09", "5"]
+    assert df["Security Code"].dtype == "Int64"
+    assert capsys.readouterr().out.count("keeping the column as text") == 3
+
+
+def test_typed_columns_are_still_typed():
+    df = urlui.coerce_disclosure_schema(pd.DataFrame({"Value": ["1,000", "", None], "Date of Allotment": ["2024-03-09", "09/03/2024", None]}))
+    assert df["Value"].tolist()[0] == 1000.0
+    assert df["Value"].dtype == "float64"
+    assert df["Date of Allotment"].tolist()[:2] == [pd.Timestamp("2024-03-09")] * 2
+
+
+def test_stream_fails_when_a_later_batch_does_not_fit_the_typed_columns(odd_values_csv):
+    with open(odd_values_csv, "rb") as f:
+        data = f.read()
+    with pytest.raises(ValueError, match="do not fit the typed column"):
+        list(urlui.iter_streamed_csv_batches([data], batch_rows=1000))
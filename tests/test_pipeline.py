@@ -0,0 +1,40 @@
+import threading
+
+import pytest
+
+import urlui
+
+
+@pytest.fixture
+def unwritable_metrics(monkeypatch, tmp_path):
+    monkeypatch.setattr(urlui, "METRICS_FILE", str(tmp_path / "missing-dir" / "metrics.prom"))
+
+
+def test_export_metrics_logs_instead_of_raising(unwritable_metrics, capsys):
+    urlui.record_job_result({"ok": True})
+    assert "Could not write" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("fail_download", [False, True])
+def test_pipeline_returns_results_when_reporting_an_outcome_fails(unwritable_metrics, monkeypatch, tmp_path, fail_download):
+    def download_stage(job):
+        if fail_download:
+            raise RuntimeError("boom")
+        job["error"] = "Download link not found"
+        return False
+
+    def on_outcome(outcome):
+        raise OSError("report sink is gone")
+
+    monkeypatch.setattr(urlui, "download_stage", download_stage)
+    pipeline = urlui.DisclosurePipeline(download_workers=1, parse_processes=0, retries=0, on_outcome=on_outcome).start()
+    try:
+        pipeline.submit(1, {"url": "http://example.invalid/a"}, str(tmp_path))
+        pipeline.submit(2, {"url": "http://example.invalid/b"}, str(tmp_path))
+        done = []
+        waiter = threading.Thread(target=lambda: done.extend(pipeline.results(2)), daemon=True)
+        waiter.start()
+        waiter.join(timeout=10)
+        assert [outcome["ok"] for outcome in done] == [False, False]
+    finally:
+        pipeline.close()
@@ -0,0 +1,151 @@
+import pandas as pd
+import pytest
+from gspread.utils import a1_to_rowcol
+
+import urlui
+
+
+class StubWorksheet:
+    def __init__(self, rows, row_count=100, col_count=10):
+        self.data = [list(row) for row in rows]
+        self.row_count = row_count
+        self.col_count = col_count
+        self.calls = []
+        self.batch_ranges = []
+
+    def _put(self, range_name, values):
+        row, col = a1_to_rowcol(range_name.split(":")[0])
+        for offset, values_row in enumerate(values):
+            while len(self.data) < row + offset:
+                self.data.append([])
+            line = self.data[row + offset - 1]
+            while len(line) < col - 1 + len(values_row):
+                line.append("")
+            for index, value in enumerate(values_row):
+                line[col - 1 + index] = "" if value is None else str(value)
+
+    def get_all_values(self, **kwargs):
+        self.calls.append("get_all_values")
+        return [list(row) for row in self.data]
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self.calls.append("update")
+        self._put(range_name, values)
+
+    def batch_update(self, data, **kwargs):
+        self.calls.append("batch_update")
+        self.batch_ranges.append([item["range"] for item in data])
+        for item in data:
+            self._put(item["range"], item["values"])
+
+    def resize(self, rows=None, cols=None):
+        self.calls.append("resize")
+        self.row_count = rows or self.row_count
+        self.col_count = cols or self.col_count
+
+
+@pytest.fixture(autouse=True)
+def unthrottled(monkeypatch):
+    monkeypatch.setattr(urlui, "sheets_write_limiter", urlui.RateLimiter(10_000, 60))
+    monkeypatch.setattr(urlui, "SHEET_UPLOAD_WORKERS", 1)
+
+
+HEADER = ["Security Code", "Name of Person", "Value"]
+
+
+def test_sync_appends_new_rows_updates_changed_ones_and_skips_the_rest():
+    worksheet = StubWorksheet([HEADER, ["500325", "Alice", "1,000"], ["500209", "Bob", "20"]])
+    df = pd.DataFrame({"Security Code": [500325, 500209, 500570],
+                       "Name of Person": ["Alice", "Bob", "Carol"],
+                       "Value": [1000, 25, 7]})
+
+    stats = urlui.sync_df_to_worksheet(worksheet, df, key_columns=["Security Code", "Name of Person"])
+
+    assert stats == {"appended": 1, "updated": 1, "unchanged": 1}
+    assert worksheet.data[1] == ["500325", "Alice", "1,000"]
+    assert worksheet.data[2] == ["500209", "Bob", "25"]
+    assert worksheet.data[3] == ["500570", "Carol", "7"]
+    assert worksheet.calls.count("batch_update") == 1
+
+
+def test_sync_without_key_columns_only_appends_unseen_rows():
+    worksheet = StubWorksheet([HEADER, ["1", "A", "10"]])
+    df = pd.DataFrame({"Security Code": [1, 1], "Name of Person": ["A", "A"], "Value": [10, 11]})
+
+    stats = urlui.sync_df_to_worksheet(worksheet, df)
+
+    assert stats == {"appended": 1, "updated": 0, "unchanged": 1}
+    assert worksheet.data == [HEADER, ["1", "A", "10"], ["1", "A", "11"]]
+    assert "batch_update" not in worksheet.calls
+
+
+def test_sync_merges_consecutive_changed_rows_into_one_range():
+    worksheet = StubWorksheet([HEADER] + [[str(code), "P", "0"] for code in range(1, 6)])
+    df = pd.DataFrame({"Security Code": [1, 2, 3, 4, 5], "Name of Person": ["P"] * 5, "Value": [0, 9, 9, 0, 9]})
+
+    urlui.sync_df_to_worksheet(worksheet, df, key_columns=["Security Code"])
+
+    assert worksheet.batch_ranges == [["A3:C4", "A6:C6"]]
+    assert [row[2] for row in worksheet.data[1:]] == ["0", "9", "9", "0", "9"]
+
+
+@pytest.mark.parametrize("rows", [[], [["Other", "Header"], ["x", "y"]]])
+def test_sync_needs_a_full_rewrite_for_an_empty_sheet_or_a_new_header(rows):
+    worksheet = StubWorksheet(rows)
+    df = pd.DataFrame({"Security Code": [1], "Name of Person": ["A"], "Value": [1]})
+    assert urlui.sync_df_to_worksheet(worksheet, df) is None
+    assert worksheet.calls == ["get_all_values"]
+
+
+def test_sync_with_unknown_key_column_needs_a_full_rewrite():
+    worksheet = StubWorksheet([HEADER, ["1", "A", "1"]])
+    df = pd.DataFrame({"Security Code": [1], "Name of Person": ["A"], "Value": [1]})
+    assert urlui.sync_df_to_worksheet(worksheet, df, key_columns=["PAN"]) is None
+
+
+def test_sync_grows_the_grid_before_appending():
+    worksheet = StubWorksheet([HEADER], row_count=2, col_count=3)
+    df = pd.DataFrame({"Security Code": [1, 2, 3], "Name of Person": ["A", "B", "C"], "Value": [1, 2, 3]})
+
+    urlui.sync_df_to_worksheet(worksheet, df)
+
+    assert worksheet.row_count == 4
+    assert len(worksheet.data) == 4
+
+
+def test_sync_uses_the_local_snapshot_instead_of_reading_the_sheet(tmp_path):
+    snapshot_path = str(tmp_path / "snapshot.json")
+    worksheet = StubWorksheet([HEADER, ["1", "A", "1"]])
+    df = pd.DataFrame({"Security Code": [1, 2], "Name of Person": ["A", "B"], "Value": [1, 2]})
+
+    assert urlui.sync_df_to_worksheet(worksheet, df, snapshot_path=snapshot_path)["appended"] == 1
+    worksheet.calls.clear()
+    stats = urlui.sync_df_to_worksheet(worksheet, df, snapshot_path=snapshot_path)
+
+    assert stats == {"appended": 0, "updated": 0, "unchanged": 2}
+    assert "get_all_values" not in worksheet.calls
+
+
+def test_sync_matches_dates_whatever_format_the_sheet_shows():
+    worksheet = StubWorksheet([HEADER[:2] + ["Date of Allotment", "Value"],
+                               ["500325", "Alice", "09/03/2024", "12.5%"],
+                               ["500209", "Bob", 45360, 0.25]])
+    df = pd.DataFrame({"Security Code": [500325, 500209], "Name of Person": ["Alice", "Bob"],
+                       "Date of Allotment": pd.to_datetime(["2024-03-09", "2024-03-09"]), "Value": ["12.5%", "25%"]})
+
+    stats = urlui.sync_df_to_worksheet(worksheet, df)
+
+    assert stats == {"appended": 0, "updated": 0, "unchanged": 2}
+    assert worksheet.calls == ["get_all_values"]
+
+
+@pytest.mark.parametrize("mode, key_columns, expected", [
+    (None, [], "full"),
+    (None, ["Security Code"], "incremental"),
+    ("incremental", [], "incremental"),
+    ("full", ["Security Code"], "full"),
+])
+def test_sync_mode_defaults_to_full_without_key_columns(monkeypatch, mode, key_columns, expected):
+    monkeypatch.setattr(urlui, "SHEET_SYNC_MODE", None)
+    monkeypatch.setattr(urlui, "SHEET_KEY_COLUMNS", key_columns)
+    assert urlui.sheet_sync_mode(mode) == expected
@@ -0,0 +1,195 @@
+import threading
+
+import pytest
+
+import urlui
+
+
+class FakeSwitchTo:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def window(self, handle):
+        self.driver.current = handle
+
+
+class FakeDriver:
+    def __init__(self, name, fail_cdp=False):
+        self.name = name
+        self.fail_cdp = fail_cdp
+        self.healthy = True
+        self.quit_called = False
+        self.windows = {"main": "about:blank"}
+        self.current = "main"
+        self.switch_to = FakeSwitchTo(self)
+        self.cookies = {}
+        self.storage = {}
+        self.cdp = []
+
+    @property
+    def window_handles(self):
+        return list(self.windows)
+
+    def visit(self, origin, handle="main"):
+        self.windows[handle] = origin
+        self.cookies.setdefault(origin, {})["session"] = self.name
+        self.storage[origin] = {"token": self.name}
+
+    def execute_script(self, script):
+        if not self.healthy:
+            raise RuntimeError("chrome not reachable")
+        if script == "return 1;":
+            return 1
+        if script == "return window.location.origin;":
+            origin = self.windows[self.current]
+            return "null" if origin == "about:blank" else origin
+        raise AssertionError(f"unexpected script {script!r}")
+
+    def execute_cdp_cmd(self, command, params):
+        if self.fail_cdp:
+            raise RuntimeError("cdp failed")
+        self.cdp.append(command)
+        if command == "Network.clearBrowserCookies":
+            self.cookies.clear()
+        elif command == "Storage.clearDataForOrigin":
+            self.storage.pop(params["origin"], None)
+
+    def delete_all_cookies(self):
+        self.cookies.pop(self.windows[self.current], None)
+
+    def close(self):
+        del self.windows[self.current]
+
+    def get(self, url):
+        self.windows[self.current] = url
+
+    def quit(self):
+        self.quit_called = True
+
+
+class FakeFactory:
+    def __init__(self):
+        self.drivers = []
+        self.fail_next = False
+
+    def __call__(self):
+        driver = FakeDriver(f"driver-{len(self.drivers)}", fail_cdp=self.fail_next)
+        self.fail_next = False
+        self.drivers.append(driver)
+        return driver
+
+
+@pytest.fixture
+def factory():
+    return FakeFactory()
+
+
+def make_pool(factory, size=1, max_uses=0):
+    return urlui.WebDriverPool(size=size, max_uses=max_uses, driver_factory=factory)
+
+
+def test_released_browser_is_reused(factory):
+    pool = make_pool(factory)
+    first = pool.acquire()
+    pool.release(first)
+    second = pool.acquire()
+    assert second is first
+    assert len(factory.drivers) == 1
+    assert pool.stats()["reused"] == 1
+
+
+def test_checkout_times_out_when_every_browser_is_busy(factory):
+    pool = make_pool(factory)
+    pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire(timeout=0.05)
+    assert pool.stats()["checkout_timeouts"] == 1
+
+
+def test_waiting_checkout_gets_the_released_browser(factory):
+    pool = make_pool(factory)
+    entry = pool.acquire()
+    threading.Timer(0.05, pool.release, args=(entry,)).start()
+    assert pool.acquire(timeout=5) is entry
+
+
+def test_unhealthy_idle_browser_is_replaced(factory):
+    pool = make_pool(factory)
+    entry = pool.acquire()
+    pool.release(entry)
+    entry.driver.healthy = False
+
+    replacement = pool.acquire()
+
+    assert replacement is not entry
+    assert entry.driver.quit_called
+    assert pool.stats()["health_failures"] == 1
+    assert pool.stats()["recycled"] == 1
+
+
+def test_browser_is_recycled_after_max_uses(factory):
+    pool = make_pool(factory, max_uses=2)
+    entry = pool.acquire()
+    pool.release(entry)
+    assert pool.acquire() is entry
+    pool.release(entry)
+
+    assert entry.driver.quit_called
+    assert pool.acquire() is not entry
+    assert len(factory.drivers) == 2
+
+
+def test_failed_prepare_hands_the_slot_back(factory):
+    pool = make_pool(factory)
+    factory.fail_next = True
+    with pytest.raises(RuntimeError, match="cdp failed"):
+        pool.acquire(timeout=0.05)
+    assert factory.drivers[0].quit_called
+    assert pool.stats()["in_use"] == 0
+
+    entry = pool.acquire(timeout=0.05)
+    assert entry.driver is factory.drivers[1]
+
+
+def test_close_while_checked_out_quits_the_browser_on_release(factory):
+    pool = make_pool(factory, size=2)
+    busy = pool.acquire()
+    idle = pool.acquire()
+    pool.release(idle)
+
+    pool.close()
+
+    assert idle.driver.quit_called
+    assert not busy.driver.quit_called
+    pool.release(busy)
+    assert busy.driver.quit_called
+    assert pool.stats()["in_use"] == 0
+    with pytest.raises(RuntimeError, match="closed"):
+        pool.acquire()
+
+
+def test_cookies_and_storage_of_every_visited_origin_are_cleared_between_uses(factory):
+    pool = make_pool(factory)
+    entry = pool.acquire()
+    driver = entry.driver
+    driver.visit("https://sso.example.com")
+    driver.visit("https://www.bseindia.com")
+    driver.visit("https://cdn.example.net", handle="popup")
+
+    pool.release(entry)
+
+    assert driver.cookies == {}
+    assert "https://www.bseindia.com" not in driver.storage
+    assert "https://cdn.example.net" not in driver.storage
+    assert driver.window_handles == ["main"]
+    assert driver.windows["main"] == "about:blank"
+
+
+def test_checkout_clears_cookies_even_though_the_browser_is_on_about_blank(factory):
+    pool = make_pool(factory)
+    entry = pool.acquire()
+    pool.release(entry)
+    entry.driver.cookies["https://sso.example.com"] = {"session": "stale"}
+
+    assert pool.acquire() is entry
+    assert entry.driver.cookies == {}
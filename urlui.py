@@ -1,344 +1,3302 @@
-import flet as ft
 import threading
 import os
 import sys
 import time
-import pandas as pd
-import gspread
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+_MODULE_IMPORT_STARTED = time.perf_counter()
 import traceback
+import atexit
+from collections import deque
+from queue import Queue, Empty
+import csv
+import argparse
+import shutil
+import uuid
+import re
+import json
+import random
+import datetime
+import codecs
+import hashlib
+import sqlite3
+import importlib
+import functools
+import itertools
+import io
+import contextlib
+import multiprocessing
+import importlib.util
+from html.parser import HTMLParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urljoin, urlparse, unquote
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+
+# === Lazy Imports ===
+# The UI, browser, Sheets and pandas stacks cost seconds to import; each is loaded the first
+# time a stage touches it, so a headless or cron run only pays for what it uses.
+IMPORT_TIMINGS = {}  # module name -> seconds spent on its first import
+_LAZY_IMPORTS = []
+
+class LazyImport:
+    def __init__(self, module_name, attribute=None):
+        self._module_name = module_name
+        self._attribute = attribute
+        self._target = None
+        _LAZY_IMPORTS.append(self)
+
+    def _resolve(self):
+        if self._target is None:
+            already_loaded = self._module_name in sys.modules
+            started = time.perf_counter()
+            module = importlib.import_module(self._module_name)
+            if not already_loaded:
+                IMPORT_TIMINGS.setdefault(self._module_name, time.perf_counter() - started)
+            self._target = getattr(module, self._attribute) if self._attribute else module
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+ft = LazyImport("flet")
+np = LazyImport("numpy")
+pd = LazyImport("pandas")
+union_categoricals = LazyImport("pandas.api.types", "union_categoricals")
+requests = LazyImport("requests")
+HTTPAdapter = LazyImport("requests.adapters", "HTTPAdapter")
+gspread = LazyImport("gspread")
+rowcol_to_a1 = LazyImport("gspread.utils", "rowcol_to_a1")
+Credentials = LazyImport("google.oauth2.credentials", "Credentials")
+InstalledAppFlow = LazyImport("google_auth_oauthlib.flow", "InstalledAppFlow")
+Request = LazyImport("google.auth.transport.requests", "Request")
+webdriver = LazyImport("selenium.webdriver")
+By = LazyImport("selenium.webdriver.common.by", "By")
+Options = LazyImport("selenium.webdriver.chrome.options", "Options")
+Service = LazyImport("selenium.webdriver.chrome.service", "Service")
+ChromeDriverManager = LazyImport("webdriver_manager.chrome", "ChromeDriverManager")
+WebDriverWait = LazyImport("selenium.webdriver.support.ui", "WebDriverWait")
+SeleniumTimeoutException = LazyImport("selenium.common.exceptions", "TimeoutException")
+EC = LazyImport("selenium.webdriver.support.expected_conditions")
 
 # === Config ===
 USER_SPECIFIED_DEFAULT_DOWNLOAD_PATH = "G:\\My Drive\\0investment\\0ravi\\Promoter Data for sheet"
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 CREDENTIALS_FILE = 'credentials.json'
 TOKEN_FILE = 'token.json'
+TOKEN_REFRESH_MARGIN_SECONDS = 300  # Refresh the OAuth token this long before it expires
 GOOGLE_SHEET_ID = 'YOUR_GOOGLE_SHEET_ID_HERE'  # <--- !!! CRITICAL: REPLACE THIS !!!
 WORKSHEET_NAME = 'bse_insider_data'
 MAX_STATUS_LABEL_LINES = 30
+STATUS_FLUSH_INTERVAL_MS = 150  # Log lines are pushed to the status label at most this often
+SHEET_SYNC_MODE = None  # 'incremental' (append new rows, update changed ones) or 'full' (clear and rewrite); None = 'incremental' only when SHEET_KEY_COLUMNS is set
+SHEET_KEY_COLUMNS = []  # Columns identifying a row for incremental sync; empty = the whole row is the key, so a corrected row is appended next to the old one
+SHEET_UPLOAD_CHUNK_ROWS = 2000  # Rows per write request
+SHEET_UPLOAD_WORKERS = 1  # Values > 1 write chunks concurrently (still within the rate budget)
+SHEET_WRITE_REQUESTS_PER_MINUTE = 55  # Sheets allows 60 write requests per minute per user
+SHEET_MAX_RETRIES = 6
+SHEET_MAX_CELLS = 10_000_000  # Google Sheets limit per spreadsheet
+SINKS = []  # Extra/alternative outputs per download, e.g. [{"type": "csv", "path": "exports/{source}.csv"}]; empty = the job's sheet only
+SINK_MAX_PARALLEL = 4
+SHEET_SNAPSHOT_DIR = None  # e.g. '.sheet_snapshots' to diff against a local copy instead of reading the sheet back
+WEBDRIVER_POOL_SIZE = 2
+WEBDRIVER_MAX_USES = 25  # Recycle a browser after this many tasks (0 = never)
+WEBDRIVER_CHECKOUT_TIMEOUT = 120
+DOWNLOAD_LINK_ID = "downloadlnk"
+USE_DIRECT_HTTP_DOWNLOAD = True  # Try a plain HTTP fetch of the export before driving Chrome
+HTTP_TIMEOUT = (10, 60)  # (connect, read) seconds
+HTTP_CHUNK_SIZE = 64 * 1024
+HTTP_POOL_SIZE = 10
+CHROME_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
+PAGE_LOAD_STRATEGY = 'eager'  # 'normal' waits for every asset, 'eager' for the DOM only, 'none' not at all
+BLOCK_PAGE_ASSETS = True  # Block images, fonts, media, ads and analytics while browsing
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.webp", "*.ico", "*.bmp",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*.mp4", "*.webm", "*.mp3",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*googlesyndication.com*",
+    "*googleadservices.com*", "*adservice.google.*", "*facebook.net*", "*hotjar.com*", "*clarity.ms*",
+]
+PAGE_READY_TIMEOUT_SECONDS = 40  # Ceiling for navigation and for the download link to become clickable
+PAGE_READY_POLL_INTERVAL = 0.1
+DOWNLOAD_TIMEOUT_SECONDS = 90  # Ceiling for the browser download itself
+ADAPTIVE_TIMEOUTS = True  # Learn per-host timeouts from recent step latencies (capped at the ceilings above)
+ADAPTIVE_TIMEOUT_SAMPLES = 50  # Recent latencies kept per host and step
+ADAPTIVE_TIMEOUT_MIN_SAMPLES = 5  # Use the ceiling until a host has this many samples
+ADAPTIVE_TIMEOUT_MULTIPLIER = 3.0  # Timeout = recent p95 x this
+ADAPTIVE_TIMEOUT_FLOOR = 5  # Seconds
+DOWNLOAD_STABLE_SECONDS = 0.5  # A finished file must keep the same size for this long
+DOWNLOAD_POLL_INTERVAL = 0.25  # Only used when watchdog (inotify/FSEvents) is unavailable
+PARSE_ENCODING_SAMPLE_BYTES = 64 * 1024
+DISCLOSURE_DATE_FORMATS = ["%d-%m-%Y", "%d/%m/%Y", "%d %b %Y", "%d-%b-%Y",  # Tried in order for dates that are not ISO 8601
+                           "%d-%m-%Y %H:%M", "%d/%m/%Y %H:%M", "%d-%m-%Y %H:%M:%S", "%d/%m/%Y %H:%M:%S", "%d %b %Y %H:%M"]
+PARSE_CSV_CHUNK_ROWS = 50_000
+PARSE_CHUNKED_THRESHOLD_BYTES = 200 * 1024 * 1024  # CSVs above this size are parsed chunk by chunk
+STREAM_CSV_EXPORTS = False  # Parse large CSV exports in batches while they download and push each batch to file sinks
+STREAM_MIN_BYTES = 100 * 1024 * 1024  # Only stream exports whose Content-Length is at least this (0 = stream every CSV)
+STREAM_BATCH_ROWS = 20_000  # Rows parsed and written per batch; bounds memory while streaming
+ARCHIVE_ENABLED = True  # Keep every download as deduplicated Parquet under ARCHIVE_DIR
+ARCHIVE_DIR = 'disclosure_archive'
+SKIP_UNCHANGED_DOWNLOADS = True  # Skip parse/upload when a download matches the last synced one
+SYNC_STATE_FILE = 'sync_state.json'
+TRACE_FILE = None  # e.g. 'traces.jsonl': one JSON line per finished span
+METRICS_FILE = None  # e.g. 'metrics.prom': Prometheus text format, rewritten after every job
+METRICS_PORT = None  # Serve /metrics over HTTP on this port during headless runs
+METRICS_HOST = '127.0.0.1'  # Interface for the metrics endpoint; '0.0.0.0' exposes it to the network
+JOB_QUEUE_DB = 'jobs.sqlite3'  # Durable queue used by the scheduled polling service
+JOB_FRAMES_DIR = '.job_frames'  # Parsed frames waiting for their upload step
+JOB_MAX_ATTEMPTS = 5  # Per stage
+JOB_RETRY_BASE_SECONDS = 30
+JOB_RETRY_MAX_SECONDS = 3600
+SCHEDULER_TICK_SECONDS = 5
+PIPELINE_DOWNLOAD_WORKERS = 2
+PIPELINE_PARSE_WORKERS = 1
+PIPELINE_UPLOAD_WORKERS = 1
+PIPELINE_PARSE_PROCESSES = 0  # >0 parses Excel files in that many worker processes
+PIPELINE_QUEUE_SIZE = 4  # Jobs waiting between stages; bounds how many parsed frames sit in memory
+PIPELINE_STATS_INTERVAL = 10  # Seconds between queue depth/throughput lines during a batch
+BATCH_CONCURRENCY = PIPELINE_DOWNLOAD_WORKERS
+BATCH_TASK_TIMEOUT = 300  # Seconds per attempt (from download start) before a late result is discarded and the URL retried
+BATCH_RETRIES = 1
+
+def _module_available(module_name):
+    return importlib.util.find_spec(module_name) is not None
+
+# === Thread-Safe UI Update Helpers ===
+def _update_ui(page, task_logic_func, *args_for_task_logic):
+    def scheduled_task_wrapper():
+        if page and page.session_id:
+            try:
+                task_logic_func(*args_for_task_logic)
+            except Exception as e:
+                original_stderr = getattr(sys, '__stderr__', sys.stderr)
+                print(f"Error during scheduled UI task execution: {e}", file=original_stderr)
+                traceback.print_exc(file=original_stderr)
+        else:
+            original_stdout = getattr(sys, '__stdout__', sys.stdout)
+            print("Debug (from _update_ui): UI update skipped, page closed before task execution.", file=original_stdout)
+
+    if page and page.session_id:
+        page.call_soon_threadsafe(scheduled_task_wrapper)
+    else:
+        original_stdout = getattr(sys, '__stdout__', sys.stdout)
+        print("Debug (from _update_ui): UI update skipped, page closed before queueing.", file=original_stdout)
+
+def set_control_value(page, control, new_value):
+    def core_task():
+        control.value = new_value
+        if hasattr(control, 'update'): control.update()
+    _update_ui(page, core_task)
+
+def set_control_disabled(page, control, is_disabled):
+    def core_task():
+        control.disabled = is_disabled
+        if hasattr(control, 'update'): control.update()
+    _update_ui(page, core_task)
+
+# === Coalesced Status Log Sink ===
+class StatusLogSink:
+    def __init__(self, page_ref, status_label_ref, max_lines=MAX_STATUS_LABEL_LINES, flush_interval_ms=STATUS_FLUSH_INTERVAL_MS):
+        self.page = page_ref
+        self.status_label = status_label_ref
+        self.flush_interval = flush_interval_ms / 1000
+        self._lines = deque(maxlen=max_lines)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._timer = None
+
+    def page_alive(self):
+        return bool(self.page and self.page.session_id)
+
+    def append(self, text, channel=None):
+        prefix = f"[{channel}] " if channel else ""
+        new_lines = [prefix + line for line in text.split('\n') if line.strip()]
+        if not new_lines:
+            return
+        if not self.page_alive():
+            original_stdout = getattr(sys, '__stdout__', None)
+            if original_stdout:
+                original_stdout.write("".join(f"(UI Page Gone) {line}\n" for line in new_lines))
+            return
+        with self._lock:
+            self._lines.extend(new_lines)
+            self._dirty = True
+            if self._timer is None:
+                # Everything logged until the timer fires goes out in a single control update.
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def set_text(self, text):
+        with self._lock:
+            self._lines.clear()
+            self._lines.extend(line for line in text.split('\n') if line.strip())
+            self._dirty = True
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._timer = None
+            if not self._dirty:
+                return
+            self._dirty = False
+            text = "\n".join(self._lines)
+        set_control_value(self.page, self.status_label, text)
+
+    def channel(self, name=None):
+        return RedirectOutput(self, name)
+
+class ConsoleLogSink:
+    # Headless counterpart of StatusLogSink: prefixes each task's lines and writes them whole.
+    def __init__(self, stream=None):
+        self.stream = stream or sys.__stdout__
+        self._lock = threading.Lock()
+
+    def append(self, text, channel=None):
+        prefix = f"[{channel}] " if channel else ""
+        lines = "".join(f"{prefix}{line}\n" for line in text.split('\n') if line.strip())
+        if lines:
+            with self._lock:
+                self.stream.write(lines)
+                self.stream.flush()
+
+    def channel(self, name=None):
+        return RedirectOutput(self, name)
+
+# === Per-Thread Redirection of print() Output to Flet UI ===
+_output_routes = {}  # thread ident -> RedirectOutput currently active on that thread
+_output_router_lock = threading.Lock()
+
+class _OutputRouter:
+    # Installed once as sys.stdout/sys.stderr; sends each thread's writes to its own channel.
+    def __init__(self, fallback):
+        self.fallback = fallback
+
+    def write(self, text):
+        route = _output_routes.get(threading.get_ident())
+        return (route or self.fallback).write(text)
+
+    def flush(self):
+        route = _output_routes.get(threading.get_ident())
+        (route or self.fallback).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.fallback, name)
+
+def _install_output_router():
+    with _output_router_lock:
+        if not isinstance(sys.stdout, _OutputRouter):
+            sys.stdout = _OutputRouter(sys.stdout)
+        if not isinstance(sys.stderr, _OutputRouter):
+            sys.stderr = _OutputRouter(sys.stderr)
+
+class RedirectOutput:
+    def __init__(self, log_sink, channel=None):
+        self.log_sink = log_sink
+        self.channel = channel
+        self.buffer = ""
+        self._previous_route = None
+
+    def write(self, text):
+        self.buffer += text
+        if '\n' in self.buffer:
+            lines_to_send, self.buffer = self.buffer.rsplit('\n', 1)
+            if lines_to_send:
+                self.log_sink.append(lines_to_send, self.channel)
+
+    def flush(self):
+        if self.buffer:
+            self.log_sink.append(self.buffer, self.channel)
+            self.buffer = ""
+
+    def __enter__(self):
+        _install_output_router()
+        thread_id = threading.get_ident()
+        self._previous_route = _output_routes.get(thread_id)
+        _output_routes[thread_id] = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+        thread_id = threading.get_ident()
+        if self._previous_route is not None:
+            _output_routes[thread_id] = self._previous_route
+        else:
+            _output_routes.pop(thread_id, None)
+        if exc_type:
+            error_message = f"ERROR in task: {exc_type.__name__}: {str(exc_val).splitlines()[0]}"
+            self.log_sink.append(error_message, self.channel)
+            original_stderr = getattr(sys, '__stderr__', None)
+            if original_stderr:
+                print(f"\n--- Worker Thread Exception (UI attempted for summary) ---", file=original_stderr)
+                traceback.print_exception(exc_type, exc_val, exc_tb, file=original_stderr)
+                print(f"--- End Worker Thread Exception ---", file=original_stderr)
+
+def run_in_current_channel(func):
+    # Wraps func so that helper threads print into the calling thread's channel.
+    route = _output_routes.get(threading.get_ident())
+    if route is None:
+        return func
+
+    def run_routed(*args, **kwargs):
+        with route.log_sink.channel(route.channel):
+            return func(*args, **kwargs)
+    return run_routed
+
+# === Tracing & Metrics ===
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+_METRIC_HELP = {
+    "urlui_span_duration_seconds": ("histogram", "Duration of each traced step."),
+    "urlui_download_bytes_total": ("counter", "Bytes of disclosure files downloaded."),
+    "urlui_rows_parsed_total": ("counter", "Rows parsed from downloaded files."),
+    "urlui_rows_uploaded_total": ("counter", "Rows written to Google Sheets."),
+    "urlui_sink_rows_total": ("counter", "Rows written per sink type."),
+    "urlui_sheets_api_calls_total": ("counter", "Google Sheets write calls, by outcome."),
+    "urlui_sheets_api_retries_total": ("counter", "Google Sheets write calls that were retried."),
+    "urlui_job_retries_total": ("counter", "URL jobs started again after a failed attempt."),
+    "urlui_jobs_total": ("counter", "Finished URL jobs, by result."),
+}
+_trace_context = threading.local()
+_trace_file_lock = threading.Lock()
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _escape_label_value(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0}
+            for position, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram["buckets"][position] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def value(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, dict(h, buckets=list(h["buckets"]))) for key, h in self._histograms.items())
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described:
+                kind, help_text = _METRIC_HELP.get(name, ("counter" if name.endswith("_total") else "histogram", ""))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+
+        for (name, label_key), value in counters:
+            describe(name)
+            lines.append(f"{name}{_format_labels(label_key)} {value}")
+        for (name, label_key), histogram in histograms:
+            describe(name)
+            for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+                lines.append(f"{name}_bucket{_format_labels(label_key, [('le', str(bound))])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(label_key, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(label_key)} {histogram['sum']:.6f}")
+            lines.append(f"{name}_count{_format_labels(label_key)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+
+class Span:
+    # Times one step. Spans opened on the same thread nest; pass trace_id to tie together the
+    # stages of one job when they run on different threads.
+    def __init__(self, name, trace_id=None, **attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error):
+        self.error = error
+
+    def __enter__(self):
+        stack = _trace_context.__dict__.setdefault("stack", [])
+        parent = stack[-1] if stack else None
+        self.trace_id = self.trace_id or (parent.trace_id if parent else uuid.uuid4().hex)
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        duration = time.perf_counter() - self._started
+        stack = _trace_context.stack
+        if self in stack:
+            stack.remove(self)
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {str(exc_value).splitlines()[0] if str(exc_value) else ''}"
+        status = "error" if self.error else "ok"
+        metrics.observe("urlui_span_duration_seconds", duration, span=self.name, status=status)
+        if TRACE_FILE:
+            record = {"trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id, "name": self.name,
+                      "start": datetime.datetime.fromtimestamp(self.started_at).isoformat(timespec="milliseconds"),
+                      "duration_ms": round(duration * 1000, 3), "status": status, "error": self.error,
+                      "thread": threading.current_thread().name, **self.attributes}
+            line = json.dumps(record, default=str) + "\n"
+            with _trace_file_lock:
+                with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                    f.write(line)
+        return False
+
+def export_metrics(metrics_path=None):
+    metrics_path = metrics_path or METRICS_FILE
+    if not metrics_path:
+        return
+    temp_path = f"{metrics_path}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(metrics.render())
+        os.replace(temp_path, metrics_path)
+    except OSError as e:
+        # A metrics file that cannot be written must never fail the job being recorded.
+        print(f"⚠️ Metrics: Could not write '{metrics_path}': {e}")
+
+def start_metrics_server(port, host=None):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    host = host or METRICS_HOST
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"Metrics: Serving Prometheus metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+def traced_stage(stage_name):
+    def decorate(stage_func):
+        @functools.wraps(stage_func)
+        def run_traced(job, *args, **kwargs):
+            with Span(stage_name, job.setdefault("trace_id", uuid.uuid4().hex), url=job["url"]) as span:
+                result = stage_func(job, *args, **kwargs)
+                span.set(rows=job.get("rows"), skipped=job.get("skipped"))
+                if job.get("error"):
+                    span.fail(job["error"])
+                return result
+        return run_traced
+    return decorate
+
+def record_job_result(job):
+    result = "skipped" if job.get("skipped") else ("ok" if job.get("ok") else "failed")
+    metrics.inc("urlui_jobs_total", result=result)
+    export_metrics()
+
+# === Chunked, Rate-Limited Sheets Writes ===
+class RateLimiter:
+    def __init__(self, max_calls, period_seconds):
+        self.capacity = max(1, max_calls)
+        self.refill_per_second = self.capacity / period_seconds
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.refill_per_second
+            time.sleep(wait_seconds)
+
+sheets_write_limiter = RateLimiter(SHEET_WRITE_REQUESTS_PER_MINUTE, 60)
+
+_RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+def _api_error_status(error):
+    status = getattr(error, 'code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status
+
+def call_sheets_api(description, func, *args, **kwargs):
+    for attempt in range(SHEET_MAX_RETRIES + 1):
+        sheets_write_limiter.acquire()
+        try:
+            result = func(*args, **kwargs)
+            metrics.inc("urlui_sheets_api_calls_total", status="ok")
+            return result
+        except (gspread.exceptions.APIError, requests.ConnectionError) as e:
+            status = _api_error_status(e) if isinstance(e, gspread.exceptions.APIError) else "connection"
+            metrics.inc("urlui_sheets_api_calls_total", status=status)
+            if attempt >= SHEET_MAX_RETRIES or (status != "connection" and status not in _RETRYABLE_STATUS_CODES):
+                raise
+            metrics.inc("urlui_sheets_api_retries_total", status=status)
+            delay = random.uniform(0.5, 1.0) * min(64, 2 ** attempt)
+            print(f"GS: {description} hit {status}; retrying in {delay:.1f}s ({attempt + 1}/{SHEET_MAX_RETRIES})...")
+            time.sleep(delay)
+
+def _sheet_cell(value):
+    if value is None or value is pd.NA or value is pd.NaT:
+        return ''
+    if isinstance(value, float) and value != value:
+        return ''
+    if isinstance(value, (pd.Timestamp, datetime.datetime)):
+        return value.strftime('%Y-%m-%d %H:%M:%S') if (value.hour or value.minute or value.second) else value.strftime('%Y-%m-%d')
+    if isinstance(value, datetime.date):
+        return value.strftime('%Y-%m-%d')
+    if hasattr(value, 'item'):  # numpy scalar
+        return _sheet_cell(value.item())
+    return value
+
+def iter_sheet_row_chunks(df, chunk_rows=None):
+    # Only one chunk of Python lists exists at a time, however large the frame is.
+    chunk_rows = chunk_rows or SHEET_UPLOAD_CHUNK_ROWS
+    for start in range(0, df.shape[0], chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        yield [[_sheet_cell(value) for value in row] for row in chunk.itertuples(index=False, name=None)]
+
+def ensure_worksheet_grid(worksheet, rows_needed, cols_needed):
+    rows = max(worksheet.row_count, rows_needed)
+    cols = max(worksheet.col_count, cols_needed)
+    if rows == worksheet.row_count and cols == worksheet.col_count:
+        return
+    if rows * cols > SHEET_MAX_CELLS:
+        raise ValueError(f"{rows} x {cols} cells exceeds the Google Sheets limit of {SHEET_MAX_CELLS:,} cells.")
+    print(f"GS: Growing worksheet grid to {rows} rows x {cols} columns...")
+    call_sheets_api("Resize", worksheet.resize, rows=rows, cols=cols)
+
+def write_row_chunks(worksheet, row_chunks, first_row, column_count, workers=None):
+    workers = workers or SHEET_UPLOAD_WORKERS
+    def write_chunk(start_row, rows):
+        cell_range = f"{rowcol_to_a1(start_row, 1)}:{rowcol_to_a1(start_row + len(rows) - 1, column_count)}"
+        call_sheets_api(f"Write {cell_range}", worksheet.update, range_name=cell_range, values=rows, value_input_option='USER_ENTERED')
+        return len(rows)
+
+    rows_written = 0
+    next_row = first_row
+    if workers <= 1:
+        for rows in row_chunks:
+            rows_written += write_chunk(next_row, rows)
+            next_row += len(rows)
+            print(f"GS: {rows_written} rows written...")
+        return rows_written
+
+    in_flight = set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sheets") as executor:
+        for rows in row_chunks:
+            if len(in_flight) >= workers * 2:
+                done, in_flight = wait_futures(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rows_written += future.result()
+                print(f"GS: {rows_written} rows written...")
+            in_flight.add(executor.submit(write_chunk, next_row, rows))
+            next_row += len(rows)
+        for future in in_flight:
+            rows_written += future.result()
+    return rows_written
+
+# === Google Sheets Functions ===
+_gspread_lock = threading.RLock()
+_gspread_client = None
+_gspread_creds = None
+_spreadsheet_cache = {}  # sheet ID -> Spreadsheet
+_worksheet_cache = {}  # (sheet ID, worksheet name) -> Worksheet
+_spreadsheet_open_locks = {}  # sheet ID -> Lock held while opening it
+_token_refresher_thread = None
+
+def _write_token_file(creds):
+    # Write-then-rename so a concurrent reader never sees a half-written token.json.
+    tmp_path = f"{TOKEN_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as token:
+        token.write(creds.to_json())
+    os.replace(tmp_path, TOKEN_FILE)
+
+def _load_credentials():
+    creds = None
+    if os.path.exists(TOKEN_FILE):
+        print("GS: Loading token...")
+        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            print("GS: Refreshing token...")
+            try:
+                creds.refresh(Request())
+            except Exception as e:
+                print(f"GS: Token refresh error: {e}")
+                return None
+        else:
+            if not os.path.exists(CREDENTIALS_FILE):
+                print(f"GS ERROR: '{CREDENTIALS_FILE}' not found! Please place it in the script directory.")
+                return None
+            print("GS: Starting OAuth (check console/browser for prompt)...")
+            try:
+                flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
+                print("GS: Please follow the OAuth prompts that may appear in your browser or console.")
+                creds = flow.run_local_server(port=0)
+            except Exception as e:
+                print(f"GS: OAuth error: {e}")
+                return None
+        _write_token_file(creds)
+        print("GS: Token saved.")
+    return creds
+
+def _seconds_until_refresh(creds):
+    if not creds.expiry:
+        return None
+    expiry = creds.expiry.replace(tzinfo=datetime.timezone.utc) if creds.expiry.tzinfo is None else creds.expiry
+    return (expiry - datetime.datetime.now(datetime.timezone.utc)).total_seconds() - TOKEN_REFRESH_MARGIN_SECONDS
+
+def _token_refresher_loop():
+    while True:
+        with _gspread_lock:
+            creds = _gspread_creds
+        if creds is None or not creds.refresh_token:
+            return
+        delay = _seconds_until_refresh(creds)
+        if delay is None:
+            return
+        if delay > 0:
+            time.sleep(delay)
+            continue
+        with _gspread_lock:
+            if creds is not _gspread_creds:
+                continue
+            try:
+                creds.refresh(Request())
+                _write_token_file(creds)
+            except Exception as e:
+                original_stderr = getattr(sys, '__stderr__', sys.stderr)
+                print(f"GS: Background token refresh failed, retrying in 60s: {e}", file=original_stderr)
+                retry = True
+            else:
+                retry = False
+        if retry:
+            time.sleep(60)
+
+def _start_token_refresher():
+    global _token_refresher_thread
+    if _token_refresher_thread is None or not _token_refresher_thread.is_alive():
+        _token_refresher_thread = threading.Thread(target=_token_refresher_loop, name="gs-token-refresher", daemon=True)
+        _token_refresher_thread.start()
+
+def _connect_gspread_client():
+    global _gspread_client, _gspread_creds
+    with _gspread_lock:
+        if _gspread_client is not None and _gspread_creds is not None and _gspread_creds.valid:
+            return _gspread_client
+        if _gspread_creds is not None and _gspread_creds.refresh_token:
+            print("GS: Refreshing cached token...")
+            try:
+                _gspread_creds.refresh(Request())
+                _write_token_file(_gspread_creds)
+                return _gspread_client
+            except Exception as e:
+                print(f"GS: Token refresh error: {e}")
+        _gspread_client = None
+        _gspread_creds = None
+        _spreadsheet_cache.clear()
+        _worksheet_cache.clear()
+
+        creds = _load_credentials()
+        if not creds:
+            return None
+        print("GS: Authorizing client...")
+        try:
+            client = gspread.authorize(creds)
+            print("GS: Client authorized.")
+        except Exception as e:
+            print(f"GS: Client auth error: {e}")
+            return None
+        _gspread_client = client
+        _gspread_creds = creds
+        _start_token_refresher()
+        return client
+
+def get_gspread_client():
+    client, creds = _gspread_client, _gspread_creds
+    if client is not None and creds is not None and creds.valid:
+        return client
+    with Span("sheets.auth") as span:
+        client = _connect_gspread_client()
+        if client is None:
+            span.fail("No authorized Google Sheets client")
+        return client
+
+def get_spreadsheet(sheet_id_param):
+    with _gspread_lock:
+        spreadsheet = _spreadsheet_cache.get(sheet_id_param)
+        open_lock = _spreadsheet_open_locks.setdefault(sheet_id_param, threading.Lock())
+    if spreadsheet is not None:
+        return spreadsheet
+    with open_lock:  # Sinks fanning out to the same spreadsheet open it once
+        with _gspread_lock:
+            spreadsheet = _spreadsheet_cache.get(sheet_id_param)
+        if spreadsheet is not None:
+            return spreadsheet
+        gc = get_gspread_client()
+        if not gc:
+            return None
+        spreadsheet = gc.open_by_key(sheet_id_param)
+        with _gspread_lock:
+            return _spreadsheet_cache.setdefault(sheet_id_param, spreadsheet)
+
+def get_worksheet(spreadsheet, sheet_id_param, worksheet_name_param):
+    key = (sheet_id_param, worksheet_name_param)
+    with _gspread_lock:
+        worksheet = _worksheet_cache.get(key)
+    if worksheet is None:
+        worksheet = spreadsheet.worksheet(worksheet_name_param)
+        with _gspread_lock:
+            worksheet = _worksheet_cache.setdefault(key, worksheet)
+    return worksheet
+
+def cache_worksheet(sheet_id_param, worksheet):
+    with _gspread_lock:
+        _worksheet_cache[(sheet_id_param, worksheet.title)] = worksheet
+
+def invalidate_sheet_cache(sheet_id_param, worksheet_name_param=None):
+    with _gspread_lock:
+        if worksheet_name_param is None:
+            _spreadsheet_cache.pop(sheet_id_param, None)
+        _worksheet_cache.pop((sheet_id_param, worksheet_name_param), None)
+
+_SHEET_EPOCH = datetime.datetime(1899, 12, 30)
+_SHEET_DATE_FORMATS = ["%Y-%m-%d", "%Y-%m-%d %H:%M:%S"]
+
+def _sheet_serial(text):
+    # Dates are compared as Sheets' serial day numbers, which is what an unformatted read returns.
+    for date_format in _SHEET_DATE_FORMATS + DISCLOSURE_DATE_FORMATS:
+        try:
+            parsed = datetime.datetime.strptime(text, date_format)
+        except ValueError:
+            continue
+        return (parsed - _SHEET_EPOCH).total_seconds() / 86400
+    return None
+
+def _normalize_cell(value):
+    # The sheet is read unformatted (numbers, date serials) while the download gives text and
+    # numbers; both sides are reduced to the same text form, whatever the sheet's display format.
+    text = "" if value is None else str(value).strip()
+    try:
+        if text.endswith("%"):
+            number = float(text[:-1].replace(",", "")) / 100
+        else:
+            number = float(text.replace(",", ""))
+    except ValueError:
+        number = _sheet_serial(text)
+        if number is None:
+            return text
+    if number != number:  # NaN
+        return ""
+    number = round(number, 9)
+    return str(int(number)) if number.is_integer() else repr(number)
+
+def _snapshot_path(sheet_id_param, worksheet_name_param):
+    if not SHEET_SNAPSHOT_DIR:
+        return None
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{sheet_id_param}__{worksheet_name_param}")
+    return os.path.join(SHEET_SNAPSHOT_DIR, f"{safe_name}.json")
+
+def _load_snapshot(snapshot_path):
+    if not snapshot_path or not os.path.exists(snapshot_path):
+        return None
+    try:
+        with open(snapshot_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"GS: Ignoring unreadable snapshot '{snapshot_path}': {e}")
+        return None
+
+def _save_snapshot(snapshot_path, rows):
+    if not snapshot_path:
+        return
+    try:
+        os.makedirs(os.path.dirname(snapshot_path) or ".", exist_ok=True)
+        tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(rows, f)
+        os.replace(tmp_path, snapshot_path)
+    except OSError as e:
+        print(f"GS: Could not save snapshot '{snapshot_path}': {e}")
+
+def _merge_row_updates(row_updates, column_count):
+    # Consecutive changed rows become one range so batch_update sends as few ranges as possible.
+    ranges = []
+    for row_number, values in sorted(row_updates, key=lambda update: update[0]):
+        if ranges and ranges[-1]["end"] == row_number - 1:
+            ranges[-1]["end"] = row_number
+            ranges[-1]["values"].append(values)
+        else:
+            ranges.append({"start": row_number, "end": row_number, "values": [values]})
+    return [{
+        "range": f"{rowcol_to_a1(r['start'], 1)}:{rowcol_to_a1(r['end'], column_count)}",
+        "values": r["values"],
+    } for r in ranges]
+
+def sync_df_to_worksheet(worksheet, df, key_columns=None, snapshot_path=None):
+    header = [str(column) for column in df.columns]
+    existing = _load_snapshot(snapshot_path)
+    source = "local snapshot"
+    if existing is None:
+        existing = worksheet.get_all_values(value_render_option='UNFORMATTED_VALUE')
+        source = "sheet"
+    if not existing or [str(cell) for cell in existing[0]] != header:
+        print("GS: Sheet is empty or its header differs from the download; a full rewrite is needed.")
+        return None
+
+    missing_keys = [column for column in (key_columns or []) if column not in header]
+    if missing_keys:
+        print(f"GS: Key column(s) {missing_keys} not in the download; a full rewrite is needed.")
+        return None
+    key_indexes = [header.index(column) for column in key_columns] if key_columns else list(range(len(header)))
+
+    existing_rows = {}
+    for row_number, row in enumerate(existing[1:], start=2):
+        normalized = [_normalize_cell(cell) for cell in row] + [""] * (len(header) - len(row))
+        existing_rows[tuple(normalized[i] for i in key_indexes)] = (row_number, normalized[:len(header)])
+    print(f"GS: Diffing {df.shape[0]} downloaded rows against {len(existing) - 1} rows from the {source}...")
+
+    appends, row_updates, unchanged = [], [], 0
+    for values in (values for rows in iter_sheet_row_chunks(df) for values in rows):
+        normalized = [_normalize_cell(cell) for cell in values]
+        key = tuple(normalized[i] for i in key_indexes)
+        match = existing_rows.get(key)
+        if match is None:
+            appends.append(values)
+            existing_rows[key] = (None, normalized)
+        elif match[0] is not None and match[1] != normalized:
+            row_updates.append((match[0], values))
+            existing_rows[key] = (match[0], normalized)
+        else:
+            unchanged += 1
+
+    update_ranges = _merge_row_updates(row_updates, len(header))
+    if update_ranges:
+        print(f"GS: Updating {len(row_updates)} changed row(s) in {len(update_ranges)} range(s)...")
+        for start in range(0, len(update_ranges), SHEET_UPLOAD_CHUNK_ROWS):
+            call_sheets_api("Batch update", worksheet.batch_update, update_ranges[start:start + SHEET_UPLOAD_CHUNK_ROWS], value_input_option='USER_ENTERED')
+    if appends:
+        print(f"GS: Appending {len(appends)} new row(s)...")
+        ensure_worksheet_grid(worksheet, len(existing) + len(appends), len(header))
+        append_chunks = (appends[start:start + SHEET_UPLOAD_CHUNK_ROWS] for start in range(0, len(appends), SHEET_UPLOAD_CHUNK_ROWS))
+        write_row_chunks(worksheet, append_chunks, len(existing) + 1, len(header))
+
+    if snapshot_path:
+        snapshot_rows = existing + [[str(cell) for cell in values] for values in appends]
+        for row_number, values in row_updates:
+            snapshot_rows[row_number - 1] = [str(cell) for cell in values]
+        _save_snapshot(snapshot_path, snapshot_rows)
+    return {"appended": len(appends), "updated": len(row_updates), "unchanged": unchanged}
+
+def sheet_sync_mode(mode=None, key_columns=None):
+    key_columns = SHEET_KEY_COLUMNS if key_columns is None else key_columns
+    return mode or SHEET_SYNC_MODE or ('incremental' if key_columns else 'full')
+
+def upload_df_to_sheet(df, sheet_id_param, worksheet_name_param, mode=None, key_columns=None):
+    mode = sheet_sync_mode(mode, key_columns)
+    with Span("sheets.upload", worksheet=worksheet_name_param, rows=df.shape[0], mode=mode) as span:
+        uploaded = _upload_df_to_sheet(df, sheet_id_param, worksheet_name_param, mode, key_columns, span)
+        if not uploaded:
+            span.fail("Google Sheets upload failed")
+        return uploaded
+
+def _upload_df_to_sheet(df, sheet_id_param, worksheet_name_param, mode, key_columns, span):
+    key_columns = SHEET_KEY_COLUMNS if key_columns is None else key_columns
+    snapshot_path = _snapshot_path(sheet_id_param, worksheet_name_param)
+    try:
+        print("GS: Connecting for upload...")
+        spreadsheet = get_spreadsheet(sheet_id_param)
+        if not spreadsheet:
+            return False
+        worksheet = None
+        created = False
+        try:
+            worksheet = get_worksheet(spreadsheet, sheet_id_param, worksheet_name_param)
+        except gspread.exceptions.WorksheetNotFound:
+            print(f"GS: Worksheet '{worksheet_name_param}' not found. Creating...")
+            try:
+                worksheet = spreadsheet.add_worksheet(title=worksheet_name_param, rows=max(100, df.shape[0]+10), cols=max(20, df.shape[1] + 5))
+                cache_worksheet(sheet_id_param, worksheet)
+                created = True
+            except Exception as e_create:
+                print(f"❌ GS: Create worksheet error: {e_create}")
+                return False
+        ws_id_url_part = f"#gid={worksheet.id}" if hasattr(worksheet, 'id') else ""
+
+        if mode == 'incremental' and not created:
+            sync_stats = sync_df_to_worksheet(worksheet, df, key_columns, snapshot_path)
+            if sync_stats is not None:
+                metrics.inc("urlui_rows_uploaded_total", sync_stats['appended'] + sync_stats['updated'], mode="incremental")
+                span.set(appended=sync_stats['appended'], updated=sync_stats['updated'], unchanged=sync_stats['unchanged'])
+                print(f"✅ GS: Incremental sync done ({sync_stats['appended']} appended, {sync_stats['updated']} updated, {sync_stats['unchanged']} unchanged). URL: {spreadsheet.url}{ws_id_url_part}")
+                return True
+
+        print(f"GS: Clearing '{worksheet_name_param}'...")
+        call_sheets_api("Clear", worksheet.clear)
+        header = [str(column) for column in df.columns]
+        ensure_worksheet_grid(worksheet, df.shape[0] + 1, len(header))
+        print(f"GS: Uploading {df.shape[0]} rows to '{worksheet_name_param}' in chunks of {SHEET_UPLOAD_CHUNK_ROWS}...")
+        call_sheets_api("Write header", worksheet.update, range_name=f"A1:{rowcol_to_a1(1, len(header))}", values=[header], value_input_option='USER_ENTERED')
+        write_row_chunks(worksheet, iter_sheet_row_chunks(df), 2, len(header))
+        if snapshot_path:
+            snapshot_rows = [header] + [[str(cell) for cell in values] for rows in iter_sheet_row_chunks(df) for values in rows]
+            _save_snapshot(snapshot_path, snapshot_rows)
+        metrics.inc("urlui_rows_uploaded_total", df.shape[0], mode="full")
+        print(f"✅ GS: Uploaded! URL: {spreadsheet.url}{ws_id_url_part}")
+        return True
+    except Exception as e:
+        error_msg = f"❌ GS Upload Error: {type(e).__name__}: {str(e).splitlines()[0]}"
+        if isinstance(e, gspread.exceptions.APIError) and "PERMISSION_DENIED" in str(e):
+            error_msg += " Check sheet sharing."
+        print(error_msg)
+        # A deleted/renamed worksheet or revoked access leaves stale handles behind.
+        invalidate_sheet_cache(sheet_id_param, worksheet_name_param)
+        invalidate_sheet_cache(sheet_id_param)
+        if snapshot_path and os.path.exists(snapshot_path):
+            # The sheet may now be partially written; force the next sync to read it back.
+            os.remove(snapshot_path)
+        original_stderr = getattr(sys, '__stderr__', sys.stderr)
+        if original_stderr:
+             print(f"Detailed Google Sheets Upload Error (Console):\n{traceback.format_exc()}", file=original_stderr)
+        return False
+
+# === Chrome WebDriver Pool ===
+_chromedriver_path = None
+_chromedriver_path_lock = threading.Lock()
+
+def get_chromedriver_path():
+    # ChromeDriverManager().install() resolves and version-checks the driver; do it once per process.
+    global _chromedriver_path
+    with _chromedriver_path_lock:
+        if _chromedriver_path is None:
+            os.environ['WDM_LOG_LEVEL'] = '0'
+            _chromedriver_path = ChromeDriverManager().install()
+        return _chromedriver_path
+
+def build_chrome_options(download_dir=None):
+    chrome_options = Options()
+    prefs = {
+        "download.prompt_for_download": False,
+        "directory_upgrade": True,
+        "safebrowsing.enabled": True
+    }
+    if download_dir:
+        prefs["download.default_directory"] = download_dir
+    if BLOCK_PAGE_ASSETS:
+        prefs["profile.managed_default_content_settings.images"] = 2
+    chrome_options.add_experimental_option("prefs", prefs)
+    chrome_options.page_load_strategy = PAGE_LOAD_STRATEGY
+    chrome_options.add_argument("--headless=new")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--window-size=1920,1080")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument('--log-level=3')
+    chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
+    chrome_options.add_argument(f"user-agent={CHROME_USER_AGENT}")
+    chrome_options.add_argument("--disable-blink-features=AutomationControlled")
+    return chrome_options
+
+def create_chrome_driver():
+    service = Service(get_chromedriver_path())
+    return webdriver.Chrome(service=service, options=build_chrome_options())
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.time()
+        self.assets_blocked = False
+
+class WebDriverPool:
+    def __init__(self, size=WEBDRIVER_POOL_SIZE, max_uses=WEBDRIVER_MAX_USES, driver_factory=None):
+        self.size = max(1, int(size))
+        self.max_uses = max_uses
+        self.driver_factory = driver_factory or create_chrome_driver
+        self._idle = []
+        self._total = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "created": 0,
+            "reused": 0,
+            "recycled": 0,
+            "health_failures": 0,
+            "waits": 0,
+            "checkout_timeouts": 0,
+        }
+
+    def _bump(self, key, amount=1):
+        with self._cond:
+            self._stats[key] += amount
+
+    def _quit(self, entry, reason):
+        print(f"Driver: Recycling browser after {entry.uses} use(s) ({reason}).")
+        try:
+            entry.driver.quit()
+        except Exception as e:
+            print(f"Driver: Error while quitting browser: {e}")
+
+    def _give_back_slot(self):
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+
+    def is_healthy(self, entry):
+        try:
+            return entry.driver.execute_script("return 1;") == 1
+        except Exception:
+            return False
+
+    def _prepare(self, entry, download_dir):
+        driver = entry.driver
+        # delete_all_cookies() only reaches the current document's domain (none on about:blank).
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        if BLOCK_PAGE_ASSETS and not entry.assets_blocked:
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+            entry.assets_blocked = True
+        if download_dir:
+            driver.execute_cdp_cmd("Page.setDownloadBehavior", {
+                "behavior": "allow",
+                "downloadPath": os.path.abspath(download_dir),
+            })
+
+    def _clear_origin_storage(self, driver):
+        try:
+            origin = driver.execute_script("return window.location.origin;")
+        except Exception:
+            return  # some error pages cannot run scripts
+        if origin and origin != "null":  # about:blank has no storage
+            driver.execute_cdp_cmd("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+
+    def _scrub(self, entry):
+        driver = entry.driver
+        handles = driver.window_handles
+        for handle in handles[1:]:
+            driver.switch_to.window(handle)
+            self._clear_origin_storage(driver)
+            driver.close()
+        driver.switch_to.window(handles[0])
+        self._clear_origin_storage(driver)
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        driver.get("about:blank")
+
+    def acquire(self, download_dir=None, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("WebDriver pool is closed.")
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._total < self.size:
+                    self._total += 1
+                    entry = None
+                    break
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    self._stats["checkout_timeouts"] += 1
+                    raise TimeoutError(f"No WebDriver became free within {timeout}s (pool size {self.size}).")
+                self._stats["waits"] += 1
+                self._cond.wait(remaining)
+            self._stats["checkouts"] += 1
+
+        # The slot is reserved from here on; it must be handed back if we fail.
+        try:
+            if entry is not None and not self.is_healthy(entry):
+                self._bump("health_failures")
+                self._quit(entry, "failed health check")
+                self._bump("recycled")
+                entry = None
+            if entry is not None:
+                try:
+                    self._prepare(entry, download_dir)
+                    self._bump("reused")
+                    return entry
+                except Exception as e:
+                    self._quit(entry, f"reset failed: {e}")
+                    self._bump("recycled")
+            entry = PooledDriver(self.driver_factory())
+            self._bump("created")
+            try:
+                self._prepare(entry, download_dir)
+            except Exception:
+                self._quit(entry, "reset failed on a fresh browser")
+                raise
+            return entry
+        except Exception:
+            self._give_back_slot()
+            raise
+
+    def release(self, entry, suspect=False):
+        entry.uses += 1
+        reason = None
+        if suspect and not self.is_healthy(entry):
+            self._bump("health_failures")
+            reason = "crashed"
+        elif self.max_uses and entry.uses >= self.max_uses:
+            reason = f"reached {self.max_uses} uses"
+        else:
+            try:
+                self._scrub(entry)
+            except Exception as e:
+                reason = f"reset failed: {e}"
+        with self._cond:
+            if reason is None and not self._closed:
+                self._idle.append(entry)
+                self._cond.notify()
+                return
+        self._quit(entry, reason or "pool closed")
+        if reason:
+            self._bump("recycled")
+        self._give_back_slot()
+
+    def ensure_size(self, size):
+        with self._cond:
+            if size > self.size:
+                self.size = size
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["size"] = self.size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._total - len(self._idle)
+            return stats
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._quit(entry, "pool closed")
+
+_webdriver_pool = None
+_webdriver_pool_lock = threading.Lock()
+
+def get_webdriver_pool():
+    global _webdriver_pool
+    with _webdriver_pool_lock:
+        if _webdriver_pool is None:
+            _webdriver_pool = WebDriverPool()
+            atexit.register(_webdriver_pool.close)
+        return _webdriver_pool
+
+# === Adaptive Browser Timeouts ===
+class AdaptiveTimeouts:
+    # Learns how long each browser step usually takes per host and times out at a multiple of
+    # the recent p95 instead of the fixed ceiling, so a stuck page frees its worker early and
+    # gets retried. Timed-out attempts count as samples too, so a host that really got slower
+    # earns longer waits.
+    def __init__(self, samples=ADAPTIVE_TIMEOUT_SAMPLES):
+        self.samples = samples
+        self._durations = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(url, step):
+        return urlparse(url).netloc.lower(), step
+
+    def record(self, url, step, seconds):
+        with self._lock:
+            self._durations.setdefault(self._key(url, step), deque(maxlen=self.samples)).append(seconds)
+
+    def timeout_for(self, url, step, ceiling):
+        if not ADAPTIVE_TIMEOUTS:
+            return ceiling
+        with self._lock:
+            durations = sorted(self._durations.get(self._key(url, step), ()))
+        if len(durations) < ADAPTIVE_TIMEOUT_MIN_SAMPLES:
+            return ceiling
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        return min(ceiling, max(ADAPTIVE_TIMEOUT_FLOOR, p95 * ADAPTIVE_TIMEOUT_MULTIPLIER))
+
+    def stats(self):
+        with self._lock:
+            return {f"{host} {step}": len(durations) for (host, step), durations in self._durations.items()}
+
+adaptive_timeouts = AdaptiveTimeouts()
+
+def is_selenium_timeout(error):
+    return isinstance(error, SeleniumTimeoutException._resolve())
+
+# === Download Completion Detection ===
+DATA_FILE_EXTENSIONS = (".xlsx", ".xls", ".csv")
+PARTIAL_DOWNLOAD_SUFFIXES = (".tmp", ".crdownload", ".part")
+
+def is_data_file_name(file_name):
+    lower = file_name.lower()
+    return lower.endswith(DATA_FILE_EXTENSIONS) and not lower.startswith("~$")
+
+class DownloadWatcher:
+    def __init__(self, directory, poll_interval=DOWNLOAD_POLL_INTERVAL, stable_seconds=DOWNLOAD_STABLE_SECONDS):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.stable_seconds = stable_seconds
+        self.backend = "polling"
+        self._changed = threading.Event()
+        self._observer = None
+
+    def __enter__(self):
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return self
+
+        changed = self._changed
+        class _ChangeHandler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                changed.set()
+
+        try:
+            self._observer = Observer()
+            self._observer.schedule(_ChangeHandler(), self.directory, recursive=False)
+            self._observer.start()
+            self.backend = "watchdog"
+        except Exception as e:
+            print(f"Download watcher: watchdog unavailable ({e}), falling back to polling.")
+            self._observer = None
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._observer:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+            self._observer = None
+
+    def wait_for_file(self, timeout_seconds):
+        start_time = time.time()
+        deadline = start_time + timeout_seconds
+        last_monitor_update_time = start_time
+        observed = {}  # file name -> (size, time the size was first seen)
+        while True:
+            self._changed.clear()
+            now = time.time()
+            names = os.listdir(self.directory)
+            in_progress = any(name.lower().endswith(PARTIAL_DOWNLOAD_SUFFIXES) for name in names)
+            pending = False
+            for name in names:
+                if not is_data_file_name(name):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    size = os.path.getsize(path)
+                except OSError:
+                    continue
+                previous = observed.get(name)
+                if previous is None or previous[0] != size:
+                    observed[name] = (size, now)
+                    pending = True
+                elif size > 0 and not in_progress and now - previous[1] >= self.stable_seconds:
+                    return path
+                else:
+                    pending = True
+
+            if now >= deadline:
+                return None
+            if now - last_monitor_update_time >= 5:
+                print(f"Monitoring download... ({int(now - start_time)}s / {timeout_seconds}s, {self.backend})")
+                last_monitor_update_time = now
+
+            if pending:
+                wait_seconds = self.stable_seconds
+            elif self._observer is None:
+                wait_seconds = self.poll_interval
+            else:
+                wait_seconds = 5
+            self._changed.wait(max(0, min(wait_seconds, deadline - now)))
+
+def move_download_into(staged_path, target_dir):
+    base_name, extension = os.path.splitext(os.path.basename(staged_path))
+    target_path = os.path.join(target_dir, base_name + extension)
+    counter = 1
+    while os.path.exists(target_path):
+        target_path = os.path.join(target_dir, f"{base_name} ({counter}){extension}")
+        counter += 1
+    shutil.move(staged_path, target_path)
+    return target_path
+
+# === Direct HTTP Download ===
+_POSTBACK_PATTERNS = [
+    re.compile(r"__doPostBack\(\s*['\"]([^'\"]*)['\"]\s*,\s*['\"]([^'\"]*)['\"]"),
+    re.compile(r"WebForm_PostBackOptions\(\s*['\"]([^'\"]*)['\"]\s*,\s*['\"]([^'\"]*)['\"]"),
+]
+_SKIPPED_INPUT_TYPES = ("submit", "button", "image", "reset", "file")
+
+class DownloadLinkParser(HTMLParser):
+    def __init__(self, link_id=DOWNLOAD_LINK_ID):
+        super().__init__(convert_charrefs=True)
+        self.link_id = link_id
+        self.forms = []
+        self.link = None
+        self.link_form = None
+        self._form = None
+        self._select = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value if value is not None else "" for name, value in attrs}
+        if tag == "form":
+            self._form = {"action": attrs.get("action", ""), "fields": []}
+            self.forms.append(self._form)
+        elif tag == "input" and self._form is not None and attrs.get("name"):
+            input_type = attrs.get("type", "text").lower()
+            if input_type in ("checkbox", "radio") and "checked" not in attrs:
+                pass
+            elif input_type not in _SKIPPED_INPUT_TYPES:
+                self._form["fields"].append((attrs["name"], attrs.get("value", "")))
+        elif tag == "select" and self._form is not None and attrs.get("name"):
+            self._select = {"name": attrs["name"], "first": None, "selected": None}
+        elif tag == "option" and self._select is not None:
+            value = attrs.get("value", "")
+            if self._select["first"] is None:
+                self._select["first"] = value
+            if "selected" in attrs:
+                self._select["selected"] = value
+
+        if attrs.get("id") == self.link_id and self.link is None:
+            self.link = dict(attrs, tag=tag)
+            self.link_form = self._form
+
+    def handle_endtag(self, tag):
+        if tag == "form":
+            self._form = None
+        elif tag == "select" and self._select is not None:
+            value = self._select["selected"] if self._select["selected"] is not None else self._select["first"]
+            if value is not None and self._form is not None:
+                self._form["fields"].append((self._select["name"], value))
+            self._select = None
+
+def resolve_download_target(page_url, html, link_id=DOWNLOAD_LINK_ID):
+    parser = DownloadLinkParser(link_id)
+    parser.feed(html)
+    parser.close()
+    link = parser.link
+    if link is None:
+        return None
+    form = parser.link_form or (parser.forms[0] if parser.forms else None)
+
+    script = " ".join(link.get(attr, "") for attr in ("href", "onclick"))
+    for pattern in _POSTBACK_PATTERNS:
+        match = pattern.search(script)
+        if match and form is not None:
+            data = [(name, value) for name, value in form["fields"] if name not in ("__EVENTTARGET", "__EVENTARGUMENT")]
+            data += [("__EVENTTARGET", match.group(1)), ("__EVENTARGUMENT", match.group(2))]
+            return {"method": "POST", "url": urljoin(page_url, form["action"]), "data": data}
+
+    if link["tag"] == "input" and link.get("name") and form is not None:
+        data = list(form["fields"]) + [(link["name"], link.get("value", ""))]
+        return {"method": "POST", "url": urljoin(page_url, form["action"]), "data": data}
+
+    href = link.get("href", "")
+    if href and not href.lower().startswith(("javascript:", "#")):
+        return {"method": "GET", "url": urljoin(page_url, href), "data": None}
+    return None
+
+_http_local = threading.local()
+_download_target_cache = {}  # page URL -> plain GET target; postbacks carry per-load view state
+_download_target_cache_lock = threading.Lock()
+
+def get_http_session():
+    session = getattr(_http_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({"User-Agent": CHROME_USER_AGENT})
+        _http_local.session = session
+    return session
+
+def _download_file_name(response, first_chunk):
+    disposition = response.headers.get("Content-Disposition", "")
+    file_name = ""
+    match = re.search(r"filename\*\s*=\s*[^']*'[^']*'([^;]+)", disposition)
+    if match:
+        file_name = unquote(match.group(1).strip())
+    else:
+        match = re.search(r'filename\s*=\s*"?([^";]+)"?', disposition)
+        if match:
+            file_name = match.group(1).strip()
+    if not file_name:
+        file_name = unquote(os.path.basename(urlparse(response.url).path))
+    file_name = os.path.basename(file_name.replace("\\", "/")) or f"disclosure-{int(time.time())}"
+    if not is_data_file_name(file_name):
+        if first_chunk.startswith(b"PK"):
+            file_name += ".xlsx"
+        elif first_chunk.startswith(b"\xd0\xcf\x11\xe0"):
+            file_name += ".xls"
+        else:
+            file_name += ".csv"
+    return file_name
+
+def first_data_chunk(chunks):
+    for chunk in chunks:
+        if chunk:
+            break
+    else:
+        raise ValueError("server returned an empty response")
+    if chunk.lstrip()[:15].lower().startswith((b"<!doctype html", b"<html")):
+        raise ValueError("server returned an HTML page instead of a data file")
+    return chunk
+
+def write_chunks_to_file(file_path, first_chunk, chunks):
+    part_path = file_path + ".part"
+    bytes_written = 0
+    try:
+        with open(part_path, "wb") as f:
+            f.write(first_chunk)
+            bytes_written += len(first_chunk)
+            for chunk in chunks:
+                if chunk:
+                    f.write(chunk)
+                    bytes_written += len(chunk)
+        os.replace(part_path, file_path)
+    except BaseException:
+        # A leftover .part file would make the browser fallback's DownloadWatcher wait for it until it times out.
+        try:
+            os.remove(part_path)
+        except OSError:
+            pass
+        raise
+    return file_path, bytes_written
+
+def stream_response_to_file(response, directory):
+    chunks = response.iter_content(chunk_size=HTTP_CHUNK_SIZE)
+    first_chunk = first_data_chunk(chunks)
+    return write_chunks_to_file(os.path.join(directory, _download_file_name(response, first_chunk)), first_chunk, chunks)
+
+def request_export(target_url, page_html=None, cookies=None):
+    # Returns the open (streaming) export response, or None when the page has no download link.
+    session = get_http_session()
+    for cookie in cookies or []:
+        session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"))
+
+    page_url = target_url
+    with _download_target_cache_lock:
+        target = _download_target_cache.get(target_url) if page_html is None else None
+    if target is None:
+        if page_html is None:
+            print("Direct: Fetching disclosure page over HTTP...")
+            page_response = session.get(target_url, timeout=HTTP_TIMEOUT)
+            page_response.raise_for_status()
+            page_html = page_response.text
+            page_url = page_response.url
+        target = resolve_download_target(page_url, page_html)
+        if target is None:
+            print(f"Direct: Download link '{DOWNLOAD_LINK_ID}' not found in the page HTML.")
+            return None
+        if target["method"] == "GET":
+            with _download_target_cache_lock:
+                _download_target_cache[target_url] = target
+
+    print(f"Direct: Requesting export ({target['method']} {target['url']})...")
+    request_kwargs = {"timeout": HTTP_TIMEOUT, "stream": True, "headers": {"Referer": page_url}}
+    if target["method"] == "POST":
+        response = session.post(target["url"], data=target["data"], **request_kwargs)
+    else:
+        response = session.get(target["url"], **request_kwargs)
+    try:
+        response.raise_for_status()
+    except requests.HTTPError:
+        response.close()
+        raise
+    return response
+
+def _direct_download_failed(target_url, span, error):
+    with _download_target_cache_lock:
+        _download_target_cache.pop(target_url, None)
+    detail = str(error).splitlines()[0] if str(error) else ""
+    print(f"Direct: Fast path failed ({type(error).__name__}: {detail or 'no details'}).")
+    span.fail(f"{type(error).__name__}: {detail}")
+
+def direct_http_download(target_url, staging_dir, page_html=None, cookies=None):
+    with Span("download.direct", url=target_url) as span:
+        try:
+            response = request_export(target_url, page_html, cookies)
+            if response is None:
+                span.fail("Download link not found")
+                return None
+            with response:
+                file_path, bytes_written = stream_response_to_file(response, staging_dir)
+            metrics.inc("urlui_download_bytes_total", bytes_written, method="direct")
+            span.set(bytes=bytes_written)
+            print(f"Direct: Downloaded {bytes_written:,} bytes without a browser.")
+            return file_path
+        except (requests.RequestException, OSError, ValueError) as e:
+            _direct_download_failed(target_url, span, e)
+            return None
+
+# === Disclosure File Parsing ===
+# Column kinds for the BSE insider-trading export, matched as lower-case substrings of the
+# header (first match wins) so that small wording changes on BSE's side do not break parsing.
+BSE_COLUMN_KINDS = [
+    ("security code", "int"),
+    ("security name", "category"),
+    ("category of person", "category"),
+    ("mode of acquisition", "category"),
+    ("type of securit", "category"),
+    ("transaction type", "category"),
+    ("derivative", "category"),
+    ("reported to exchange", "date"),
+    ("exchange", "category"),
+    ("date", "date"),
+    ("number of securit", "float"),
+    ("value", "float"),
+    ("shareholding", "float"),
+    ("%", "float"),
+]
+
+def disclosure_column_kind(column_name):
+    lower = str(column_name).strip().lower()
+    for pattern, kind in BSE_COLUMN_KINDS:
+        if pattern in lower:
+            return kind
+    return None
+
+def detect_encoding(file_path, sample_bytes=PARSE_ENCODING_SAMPLE_BYTES):
+    with open(file_path, 'rb') as f:
+        return detect_sample_encoding(f.read(sample_bytes))
+
+def detect_sample_encoding(sample):
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    try:
+        # final=False tolerates a multi-byte character cut off at the end of the sample.
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin1'
+
+def _to_numeric(series):
+    if series.dtype == object or pd.api.types.is_string_dtype(series):
+        series = series.astype(str).str.replace(",", "", regex=False).str.strip()
+    return pd.to_numeric(series, errors='coerce')
+
+def parse_disclosure_dates(series):
+    # ISO dates first: a day-first parser would read '2024-03-09' as 3 September.
+    text = series.astype("string").str.strip()
+    parsed = pd.to_datetime(text, errors='coerce', format='ISO8601')
+    for date_format in DISCLOSURE_DATE_FORMATS:
+        missing = parsed.isna() & text.fillna("").ne("")
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(text[missing], errors='coerce', format=date_format)
+    return parsed
+
+def _keeps_text(column, kind, original, coerced, text_columns):
+    # Non-empty values the schema cannot read (e.g. '12.5%', '-') would otherwise become empty cells.
+    if column not in text_columns:
+        text = original.astype("string").str.strip()
+        lost = coerced.isna() & text.notna() & text.ne("")
+        if not lost.any():
+            return False
+        examples = ", ".join(repr(value) for value in text[lost].unique()[:3])
+        print(f"⚠️ Parse: {int(lost.sum())} value(s) in '{column}' are not a {kind} (e.g. {examples}); keeping the column as text.")
+        text_columns.add(column)
+    return True
+
+def coerce_disclosure_schema(df, text_columns=None):
+    # text_columns collects the columns left as text; sharing one set across the chunks of a file
+    # keeps such a column text in every later chunk too.
+    text_columns = set() if text_columns is None else text_columns
+    for column in df.columns:
+        kind = disclosure_column_kind(column)
+        series = df[column]
+        if kind == "category":
+            if not isinstance(series.dtype, pd.CategoricalDtype):
+                df[column] = series.astype("category")
+        elif kind == "date":
+            if not pd.api.types.is_datetime64_any_dtype(series):
+                parsed = parse_disclosure_dates(series)
+                if _keeps_text(column, kind, series, parsed, text_columns):
+                    continue
+                series = parsed
+            # Engines differ in resolution (pyarrow gives seconds); one unit keeps row hashes comparable
+            # between streamed batches, whole-file reads and the archive.
+            df[column] = series.astype("datetime64[ns]")
+        elif kind in ("float", "int"):
+            numbers = _to_numeric(series)
+            if _keeps_text(column, kind, series, numbers, text_columns):
+                continue
+            df[column] = numbers.astype("float64" if kind == "float" else "Int64")
+    return df
+
+def _csv_category_dtypes(file_path, encoding):
+    header = pd.read_csv(file_path, encoding=encoding, nrows=0).columns
+    return {column: "category" for column in header if disclosure_column_kind(column) == "category"}
+
+def iter_disclosure_csv_chunks(file_path, chunk_rows=None, encoding=None, text_columns=None):
+    encoding = encoding or detect_encoding(file_path)
+    dtypes = _csv_category_dtypes(file_path, encoding)
+    text_columns = set() if text_columns is None else text_columns
+    dtypes.update({column: str for column in text_columns})
+    for chunk in pd.read_csv(file_path, encoding=encoding, dtype=dtypes, chunksize=chunk_rows or PARSE_CSV_CHUNK_ROWS):
+        yield coerce_disclosure_schema(chunk, text_columns)
+
+def iter_streamed_csv_batches(byte_chunks, batch_rows=None):
+    # Parses a CSV while it downloads: bytes are decoded incrementally, lines are grouped into
+    # records (a quoted field may span lines) and every batch_rows records become one DataFrame.
+    batch_rows = batch_rows or STREAM_BATCH_ROWS
+    byte_chunks = iter(byte_chunks)
+    sample = b""
+    for chunk in byte_chunks:
+        sample += chunk
+        if len(sample) >= PARSE_ENCODING_SAMPLE_BYTES:
+            break
+    if not sample:
+        raise ValueError("server returned an empty response")
+    decoder = codecs.getincrementaldecoder(detect_sample_encoding(sample))(errors="replace")
+
+    header = None
+    dtypes = {}
+    records, record, quotes, pending = [], [], 0, ""
+    batches = 0
+
+    text_columns = set()
+
+    def parse(batch_records):
+        # Untyped columns are read as text so that every batch comes out with the same schema.
+        known_text = set(text_columns)
+        batch = coerce_disclosure_schema(pd.read_csv(io.StringIO(header + "".join(batch_records)), dtype=dtypes), text_columns)
+        if batches > 1 and text_columns != known_text:
+            # Earlier batches already went to the sinks typed; a text column now would not match them.
+            raise ValueError(f"batch {batches} has values that do not fit the typed column(s) {sorted(text_columns - known_text)}")
+        return batch
+
+    def add_line(line):
+        nonlocal header, dtypes, record, quotes
+        record.append(line)
+        quotes += line.count('"')
+        if quotes % 2:
+            return
+        text = "".join(record)
+        record, quotes = [], 0
+        if header is None:
+            header = text if text.endswith("\n") else text + "\n"
+            columns = pd.read_csv(io.StringIO(header), nrows=0).columns
+            dtypes = {column: ("category" if disclosure_column_kind(column) == "category" else str)
+                      for column in columns if disclosure_column_kind(column) in ("category", None)}
+        elif text.strip():
+            records.append(text if text.endswith("\n") else text + "\n")
+
+    for chunk in itertools.chain([sample], byte_chunks):
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            add_line(line + "\n")
+        while len(records) >= batch_rows:
+            batches += 1
+            yield parse(records[:batch_rows])
+            del records[:batch_rows]
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        add_line(pending)
+    if record:
+        raise ValueError("CSV ended inside a quoted field")
+    while records or not batches:
+        if header is None:
+            raise ValueError("CSV has no header row")
+        batches += 1
+        yield parse(records[:batch_rows])
+        del records[:batch_rows]
+
+def _concat_chunks(chunks):
+    if len(chunks) == 1:
+        return chunks[0]
+    df = pd.concat(chunks, ignore_index=True)
+    for column in chunks[0].columns:
+        if isinstance(chunks[0][column].dtype, pd.CategoricalDtype):
+            # Chunks carry different category sets; concat falls back to object unless unioned.
+            df[column] = union_categoricals([chunk[column] for chunk in chunks])
+    return df
+
+def _binary_columns(df):
+    # pyarrow returns a column as raw bytes when it is not valid in the requested encoding.
+    columns = []
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            sample = series.cat.categories[:1].tolist()
+        elif series.dtype == object:
+            sample = series.dropna().head(1).tolist()
+        else:
+            continue
+        if sample and isinstance(sample[0], bytes):
+            columns.append(column)
+    return columns
+
+def _read_disclosure_csv_with(file_path, encoding, text_columns):
+    if os.path.getsize(file_path) > PARSE_CHUNKED_THRESHOLD_BYTES:
+        known_text = set(text_columns)
+        chunks = list(iter_disclosure_csv_chunks(file_path, encoding=encoding, text_columns=text_columns))
+        if len(chunks) > 1 and text_columns != known_text:
+            # Chunks before the one that turned a column into text were typed; read again with it as text throughout.
+            chunks = list(iter_disclosure_csv_chunks(file_path, encoding=encoding, text_columns=text_columns))
+        return _concat_chunks(chunks), f"c/chunked, {encoding}"
+    dtypes = _csv_category_dtypes(file_path, encoding)
+    if _module_available("pyarrow"):
+        try:
+            df = pd.read_csv(file_path, encoding=encoding, dtype=dtypes, engine="pyarrow")
+            binary_columns = _binary_columns(df)
+            if not binary_columns:
+                return df, f"pyarrow, {encoding}"
+            print(f"Parse: pyarrow read {binary_columns} as bytes under {encoding}, using the default engine.")
+        except Exception as e:
+            print(f"Parse: pyarrow CSV engine failed ({type(e).__name__}), using the default engine.")
+    return pd.read_csv(file_path, encoding=encoding, dtype=dtypes), f"c, {encoding}"
+
+def _read_disclosure_csv(file_path, text_columns):
+    encoding = detect_encoding(file_path)
+    try:
+        return _read_disclosure_csv_with(file_path, encoding, text_columns)
+    except UnicodeDecodeError as e:
+        # The guess only sees the first PARSE_ENCODING_SAMPLE_BYTES; latin1 decodes any byte, as the original tool relied on.
+        print(f"Parse: {encoding} decoding failed ({e.reason}), retrying as latin1.")
+        return _read_disclosure_csv_with(file_path, 'latin1', text_columns)
+
+def _read_disclosure_excel(file_path):
+    if _module_available("python_calamine"):
+        try:
+            return pd.read_excel(file_path, engine="calamine"), "calamine"
+        except Exception as e:
+            print(f"Parse: calamine engine failed ({type(e).__name__}), using the default engine.")
+    return pd.read_excel(file_path), "default"
+
+def read_disclosure_file(file_path):
+    lower = file_path.lower()
+    started = time.perf_counter()
+    text_columns = set()
+    if lower.endswith((".xlsx", ".xls")):
+        df, engine = _read_disclosure_excel(file_path)
+    elif lower.endswith(".csv"):
+        df, engine = _read_disclosure_csv(file_path, text_columns)
+    else:
+        return None
+    df = coerce_disclosure_schema(df, text_columns)
+    elapsed = time.perf_counter() - started
+    memory_bytes = int(df.memory_usage(deep=True).sum())
+    df.attrs["parse_stats"] = {"seconds": elapsed, "memory_bytes": memory_bytes, "engine": engine}
+    print(f"Parse: {df.shape[0]} rows x {df.shape[1]} columns in {elapsed:.2f}s ({engine}); in-memory size {memory_bytes / 1024 / 1024:.2f} MB.")
+    return df
+
+# === Local Parquet Archive ===
+_archive_lock = threading.Lock()
+_ARCHIVE_PARTITIONING_FIELDS = (("source", "string"), ("date", "string"))
+
+def archive_source_key(source_url):
+    parsed = urlparse(source_url)
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", f"{parsed.netloc}{parsed.path}").strip("-")[:80]
+    digest = hashlib.sha1(source_url.encode("utf-8")).hexdigest()[:10]
+    return f"{slug}-{digest}"
+
+def disclosure_row_hashes(df):
+    data_columns = [column for column in df.columns if not str(column).startswith("_")]
+    return pd.util.hash_pandas_object(df[data_columns], index=False).astype("uint64")
+
+def _archive_dataset(archive_dir):
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    partitioning = ds.partitioning(pa.schema([(name, getattr(pa, kind)()) for name, kind in _ARCHIVE_PARTITIONING_FIELDS]), flavor="hive")
+    return ds.dataset(archive_dir, format="parquet", partitioning=partitioning)
+
+def _archived_row_hashes(archive_dir, source_key):
+    source_dir = os.path.join(archive_dir, f"source={source_key}")
+    if not os.path.isdir(source_dir):
+        return pd.Series([], dtype="uint64")
+    table = _archive_dataset(source_dir).to_table(columns=["_row_hash"])
+    return table.column("_row_hash").to_pandas()
+
+def stable_arrow_schema(schema):
+    # Category sets (and so dictionary index widths) differ between batches and an all-empty column
+    # has no type yet; normalizing both lets every later batch be cast to the first batch's schema.
+    import pyarrow as pa
+    fields = []
+    for field in schema:
+        if pa.types.is_dictionary(field.type):
+            field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+        elif pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        fields.append(field)
+    return pa.schema(fields, metadata=schema.metadata)
+
+class ArchiveWriter:
+    # Archives one download, possibly arriving in batches: the source's archived row hashes are read
+    # once and every new row goes into a single Parquet file that appears when close() is called.
+    def __init__(self, source_url, snapshot_date=None, archive_dir=None):
+        self.source_url = source_url
+        self.archive_dir = archive_dir or ARCHIVE_DIR
+        self.snapshot_date = snapshot_date or datetime.date.today()
+        self.source_key = archive_source_key(source_url)
+        self.rows = 0
+        self.new_rows = 0
+        self._archived = None
+        self._seen = set()
+        self._writer = None
+        self._schema = None
+        self._file_path = None
+
+    def write(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self._archived is None:
+            self._archived = np.sort(_archived_row_hashes(self.archive_dir, self.source_key).to_numpy())
+        hashes = disclosure_row_hashes(df)
+        values = hashes.to_numpy()
+        # Binary search against the sorted archive keeps each batch's check independent of the archive size.
+        is_new = ~hashes.duplicated().to_numpy()
+        if len(self._archived):
+            positions = np.minimum(np.searchsorted(self._archived, values), len(self._archived) - 1)
+            is_new &= self._archived[positions] != values
+        if self._seen:
+            is_new &= np.fromiter((value not in self._seen for value in values.tolist()), dtype=bool, count=len(values))
+        self.rows += df.shape[0]
+        new_rows = df.loc[is_new].copy()
+        if new_rows.empty:
+            return 0
+        new_rows["_row_hash"] = values[is_new]
+        new_rows["_source_url"] = self.source_url
+        self._seen.update(new_rows["_row_hash"].tolist())
+
+        table = pa.Table.from_pandas(new_rows, preserve_index=False)
+        if self._writer is None:
+            partition_dir = os.path.join(self.archive_dir, f"source={self.source_key}", f"date={self.snapshot_date:%Y-%m-%d}")
+            os.makedirs(partition_dir, exist_ok=True)
+            self._file_path = os.path.join(partition_dir, f"part-{time.strftime('%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet")
+            self._schema = stable_arrow_schema(table.schema)
+            self._writer = pq.ParquetWriter(self._file_path + ".tmp", self._schema)
+        self._writer.write_table(table.cast(self._schema))
+        self.new_rows += new_rows.shape[0]
+        return new_rows.shape[0]
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            os.remove(self._file_path + ".tmp")
+
+    def close(self):
+        if self._writer is None:
+            print(f"Archive: All {self.rows} rows already archived for this URL.")
+            return 0
+        self._writer.close()
+        self._writer = None
+        os.replace(self._file_path + ".tmp", self._file_path)
+        print(f"Archive: Stored {self.new_rows} new rows ({self.rows - self.new_rows} already archived) in {os.path.dirname(self._file_path)}")
+        return self.new_rows
+
+def archive_snapshot(df, source_url, snapshot_date=None, archive_dir=None):
+    if not _module_available("pyarrow"):
+        print("Archive: pyarrow is not installed; snapshot NOT archived.")
+        return None
+    with _archive_lock:
+        archive = ArchiveWriter(source_url, snapshot_date, archive_dir)
+        try:
+            archive.write(df)
+        except Exception:
+            archive.abort()
+            raise
+        return archive.close()
+
+def _find_archive_column(schema_names, kind_pattern):
+    for name in schema_names:
+        if kind_pattern in str(name).lower():
+            return name
+    return None
+
+def query_archive(security=None, person=None, start_date=None, end_date=None, source_url=None, columns=None, archive_dir=None):
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    archive_dir = archive_dir or ARCHIVE_DIR
+    if not os.path.isdir(archive_dir):
+        return pd.DataFrame()
+    dataset = _archive_dataset(archive_dir)
+    names = dataset.schema.names
+
+    # Partition filters prune whole directories; column filters are pushed down into the Parquet scan.
+    conditions = []
+    if source_url:
+        conditions.append(ds.field("source") == archive_source_key(source_url))
+    if start_date:
+        conditions.append(ds.field("date") >= str(pd.Timestamp(start_date).date()))
+    if end_date:
+        conditions.append(ds.field("date") <= str(pd.Timestamp(end_date).date()))
+    if security:
+        code_column = _find_archive_column(names, "security code")
+        name_column = _find_archive_column(names, "security name")
+        if str(security).isdigit() and code_column:
+            conditions.append(ds.field(code_column) == int(security))
+        elif name_column:
+            conditions.append(pc.match_substring(ds.field(name_column).cast("string"), str(security), ignore_case=True))
+    if person:
+        person_column = _find_archive_column(names, "name of person")
+        if person_column:
+            conditions.append(pc.match_substring(ds.field(person_column).cast("string"), str(person), ignore_case=True))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    if columns is None:
+        columns = [name for name in names if name not in ("_row_hash", "source")]
+    return dataset.to_table(columns=list(columns), filter=expression).to_pandas()
+
+# === Content Fingerprints ===
+_sync_state_lock = threading.Lock()
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def frame_fingerprint(df):
+    return row_hashes_fingerprint(df.columns, disclosure_row_hashes(df).to_numpy())
+
+def row_hashes_fingerprint(columns, row_hashes):
+    # Row order and file metadata (e.g. the timestamp inside an .xlsx) must not change the fingerprint.
+    digest = hashlib.sha256("\x1f".join(str(column) for column in columns).encode("utf-8"))
+    digest.update(np.sort(row_hashes).tobytes())
+    return digest.hexdigest()
+
+def sync_target_key(target_url, sheet_id, worksheet_name):
+    return f"{target_url}|{sheet_id}|{worksheet_name}"
+
+def job_target_key(job):
+    if job.get("sinks"):
+        signature = hashlib.sha1(json.dumps(job["sinks"], sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+        return f"{job['url']}|sinks:{signature}"
+    return sync_target_key(job["url"], job["sheet_id"], job["worksheet"])
+
+def _load_sync_state():
+    if not os.path.exists(SYNC_STATE_FILE):
+        return {}
+    try:
+        with open(SYNC_STATE_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Fingerprint: Ignoring unreadable state file '{SYNC_STATE_FILE}': {e}")
+        return {}
+
+def get_synced_fingerprint(target_key):
+    with _sync_state_lock:
+        return _load_sync_state().get(target_key)
+
+def record_synced_fingerprint(target_key, file_hash, frame_hash, rows):
+    with _sync_state_lock:
+        state = _load_sync_state()
+        state[target_key] = {
+            "file_sha256": file_hash,
+            "frame_sha256": frame_hash,
+            "rows": rows,
+            "synced_at": datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        tmp_path = f"{SYNC_STATE_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, SYNC_STATE_FILE)
+
+# === Output Sinks ===
+# A sink spec is a JSON-friendly dict: {"type": "sheet" | "csv" | "parquet", "name": ...,
+# "filter": {column: value or [values]}, "columns": [...], plus the type's own settings}.
+def _find_column(df, column_name):
+    wanted = str(column_name).strip().lower()
+    for column in df.columns:
+        if str(column).strip().lower() == wanted:
+            return column
+    raise KeyError(f"column '{column_name}' is not in the download")
+
+class DisclosureSink:
+    kind = None
+    streams = False  # Whether the sink implements the streaming protocol below
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.filter = spec.get("filter") or {}
+        self.columns = spec.get("columns") or []
+        self.name = spec.get("name") or f"{self.kind}:{self.describe()}"
+        self.view_key = json.dumps({"filter": self.filter, "columns": self.columns}, sort_keys=True, default=str)
+
+    def describe(self):
+        return ""
+
+    def apply_view(self, df):
+        view = df
+        if self.filter:
+            mask = pd.Series(True, index=df.index)
+            for column_name, wanted in self.filter.items():
+                values = wanted if isinstance(wanted, list) else [wanted]
+                normalized = view[_find_column(df, column_name)].astype("string").str.strip().str.lower()
+                mask &= normalized.isin([str(value).strip().lower() for value in values]).fillna(False)
+            view = df[mask]
+        if self.columns:
+            view = view[[_find_column(view, column_name) for column_name in self.columns]]
+        return view
+
+    def write(self, df, job):
+        raise NotImplementedError
+
+    # Streaming protocol: open_stream once, write_batch per parsed batch, close_stream(completed) always.
+    # Sheet sinks do not stream: they need the whole download for incremental sync and must not be
+    # left half-written when a download fails partway.
+    def open_stream(self, job):
+        raise NotImplementedError
+
+    def write_batch(self, df):
+        raise NotImplementedError
+
+    def close_stream(self, completed):
+        pass
+
+class GoogleSheetSink(DisclosureSink):
+    kind = "sheet"
+
+    def describe(self):
+        return self.spec.get("worksheet") or ""
+
+    def write(self, df, job):
+        sheet_id = self.spec.get("sheet_id")
+        if not sheet_id or sheet_id == 'YOUR_GOOGLE_SHEET_ID_HERE':
+            raise ValueError("Google Sheet ID not configured")
+        return upload_df_to_sheet(df, sheet_id, self.spec["worksheet"], self.spec.get("mode"), self.spec.get("key_columns"))
+
+class _FileSink(DisclosureSink):
+    streams = True
+
+    def __init__(self, spec):
+        if not spec.get("path"):
+            raise ValueError(f"{self.kind} sink needs a 'path'")
+        super().__init__(spec)
+
+    def describe(self):
+        return self.spec["path"]
+
+    def output_path(self, job):
+        return self.spec["path"].format(source=archive_source_key(job["url"]), date=datetime.date.today().isoformat())
+
+    def write(self, df, job):
+        output_path = self.output_path(job)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        temp_path = f"{output_path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            self.write_file(df, temp_path)
+            os.replace(temp_path, output_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        print(f"Sink: Wrote {df.shape[0]} rows to {output_path}")
+        return True
+
+    def open_stream(self, job):
+        self._stream_path = self.output_path(job)
+        os.makedirs(os.path.dirname(self._stream_path) or ".", exist_ok=True)
+        self._stream_temp_path = f"{self._stream_path}.{uuid.uuid4().hex[:8]}.tmp"
+        self._stream_rows = 0
+        self.open_file_stream(self._stream_temp_path)
+
+    def write_batch(self, df):
+        self.write_file_batch(df)
+        self._stream_rows += df.shape[0]
+
+    def close_stream(self, completed):
+        try:
+            self.close_file_stream()
+            if completed:
+                os.replace(self._stream_temp_path, self._stream_path)
+                print(f"Sink: Streamed {self._stream_rows} rows to {self._stream_path}")
+        finally:
+            if os.path.exists(self._stream_temp_path):
+                os.remove(self._stream_temp_path)
+
+class CsvSink(_FileSink):
+    kind = "csv"
+
+    def write_file(self, df, file_path):
+        df.to_csv(file_path, index=False, encoding=self.spec.get("encoding", "utf-8"))
+
+    def open_file_stream(self, file_path):
+        self._stream_file = open(file_path, "w", newline="", encoding=self.spec.get("encoding", "utf-8"))
+        self._header_written = False
+
+    def write_file_batch(self, df):
+        df.to_csv(self._stream_file, index=False, header=not self._header_written)
+        self._header_written = True
+
+    def close_file_stream(self):
+        self._stream_file.close()
+
+class ParquetSink(_FileSink):
+    kind = "parquet"
+
+    def write_file(self, df, file_path):
+        df.to_parquet(file_path, index=False, compression=self.spec.get("compression", "zstd"))
+
+    def open_file_stream(self, file_path):
+        self._stream_file_path = file_path
+        self._writer = None
+
+    def write_file_batch(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._schema = stable_arrow_schema(table.schema)
+            self._writer = pq.ParquetWriter(self._stream_file_path, self._schema, compression=self.spec.get("compression", "zstd"))
+        self._writer.write_table(table.cast(self._schema))
+
+    def close_file_stream(self):
+        if self._writer is not None:
+            self._writer.close()
+
+SINK_TYPES = {sink_class.kind: sink_class for sink_class in (GoogleSheetSink, CsvSink, ParquetSink)}
+
+def build_sink(spec):
+    sink_class = SINK_TYPES.get(spec.get("type"))
+    if sink_class is None:
+        raise ValueError(f"unknown sink type '{spec.get('type')}' (expected one of: {', '.join(SINK_TYPES)})")
+    return sink_class(spec)
+
+def resolve_sink_specs(sink_specs, sheet_id, worksheet_name):
+    # Sheet sinks without their own target write to the job's sheet, so batch entries still pick the sheet.
+    resolved = []
+    for spec in sink_specs:
+        spec = dict(spec)
+        if spec.get("type") == "sheet":
+            spec.setdefault("sheet_id", sheet_id)
+            spec.setdefault("worksheet", worksheet_name)
+        build_sink(spec)
+        resolved.append(spec)
+    return resolved
+
+def load_sink_specs(sinks_path):
+    with open(sinks_path, encoding='utf-8') as f:
+        sink_specs = json.load(f)
+    if not isinstance(sink_specs, list):
+        raise ValueError(f"{sinks_path}: expected a JSON list of sinks")
+    for spec in sink_specs:
+        build_sink(spec)
+    return sink_specs
+
+def write_to_sinks(df, job, sink_specs):
+    sinks = [build_sink(spec) for spec in sink_specs]
+    views = {}
+    for sink in sinks:
+        if sink.view_key not in views:
+            try:
+                views[sink.view_key] = sink.apply_view(df)
+            except (KeyError, ValueError) as e_view:
+                views[sink.view_key] = e_view
+
+    def write_one(sink):
+        view = views[sink.view_key]
+        started = time.perf_counter()
+        rows = None if isinstance(view, Exception) else view.shape[0]
+        with Span(f"sink.{sink.kind}", job.get("trace_id"), sink=sink.name, rows=rows) as span:
+            try:
+                if isinstance(view, Exception):
+                    raise view
+                error = None if sink.write(view, job) else f"{sink.kind} write failed"
+            except Exception as e_sink:
+                error = f"{type(e_sink).__name__}: {str(e_sink).splitlines()[0] if str(e_sink) else ''}"
+            if error:
+                span.fail(error)
+                print(f"❌ Sink '{sink.name}' FAILED: {error}")
+            else:
+                metrics.inc("urlui_sink_rows_total", rows, sink=sink.kind)
+        return {"sink": sink.name, "ok": error is None, "rows": rows, "seconds": time.perf_counter() - started, "error": error}
+
+    if len(sinks) == 1:
+        return [write_one(sinks[0])]
+    print(f"Sink: Writing to {len(sinks)} sinks in parallel ({len(views)} distinct view(s))...")
+    with ThreadPoolExecutor(max_workers=min(len(sinks), SINK_MAX_PARALLEL), thread_name_prefix="sink") as executor:
+        return list(executor.map(run_in_current_channel(write_one), sinks))
+
+def stream_to_sinks(batches, job, sink_specs):
+    sinks = [build_sink(spec) for spec in sink_specs]
+    results = [{"sink": sink.name, "ok": True, "rows": 0, "seconds": 0.0, "error": None} for sink in sinks]
+
+    def step(index, method, *args, view=None):
+        sink, result = sinks[index], results[index]
+        if method == "close_stream":
+            args = (args[0] and result["ok"],)
+        elif not result["ok"]:
+            return
+        started = time.perf_counter()
+        rows = view.shape[0] if isinstance(view, pd.DataFrame) else None
+        with Span(f"sink.{sink.kind}", job.get("trace_id"), sink=sink.name, step=method, rows=rows) as span:
+            try:
+                if isinstance(view, Exception):
+                    raise view
+                getattr(sink, method)(*(args if view is None else (view,)))
+                if rows is not None:
+                    result["rows"] += rows
+                    metrics.inc("urlui_sink_rows_total", rows, sink=sink.kind)
+            except Exception as e_sink:
+                error = f"{type(e_sink).__name__}: {str(e_sink).splitlines()[0] if str(e_sink) else ''}"
+                span.fail(error)
+                if result["ok"]:
+                    print(f"❌ Sink '{sink.name}' FAILED: {error}")
+                    result.update(ok=False, error=error)
+        result["seconds"] += time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=min(len(sinks), SINK_MAX_PARALLEL), thread_name_prefix="sink") as executor:
+        def run_all(method, *args, views=None):
+            return [executor.submit(run_in_current_channel(step), index, method, *args, view=views and views[index])
+                    for index in range(len(sinks))]
+
+        wait_futures(run_all("open_stream", job))
+        in_flight = []
+        completed = False
+        try:
+            for batch in batches:
+                views = {}
+                for sink in sinks:
+                    if sink.view_key not in views:
+                        try:
+                            views[sink.view_key] = sink.apply_view(batch)
+                        except (KeyError, ValueError) as e_view:
+                            views[sink.view_key] = e_view
+                # The previous batch must land before this one is sent: rows stay in order and at
+                # most two batches are held in memory while the next one downloads and parses.
+                wait_futures(in_flight)
+                if not any(result["ok"] for result in results):
+                    break
+                in_flight = run_all("write_batch", views=[views[sink.view_key] for sink in sinks])
+            else:
+                completed = True
+        finally:
+            wait_futures(in_flight)
+            wait_futures(run_all("close_stream", completed))
+    if not completed:
+        for result in results:
+            if result["ok"]:
+                result.update(ok=False, error="stream aborted")
+    return results
+
+# === Streaming CSV Exports ===
+def _should_stream(file_name, content_length):
+    if not file_name.lower().endswith(".csv"):
+        return False
+    return STREAM_MIN_BYTES <= 0 or content_length >= STREAM_MIN_BYTES
+
+def stream_csv_export(job, staging_dir):
+    # Returns (handled, staged_file_path). Large CSV exports are parsed and written to the sinks
+    # batch by batch while they download (handled=True, the job is finished or failed); anything
+    # else is saved to staging_dir like a normal direct download, or (False, None) if that failed.
+    target_url = job["url"]
+    with Span("download.stream", job.get("trace_id"), url=target_url) as span:
+        try:
+            response = request_export(target_url)
+            if response is None:
+                span.fail("Download link not found")
+                return False, None
+            with response:
+                chunks = response.iter_content(chunk_size=HTTP_CHUNK_SIZE)
+                first_chunk = first_data_chunk(chunks)
+                file_name = _download_file_name(response, first_chunk)
+                content_length = int(response.headers.get("Content-Length") or 0)
+                if not _should_stream(file_name, content_length):
+                    file_path, bytes_written = write_chunks_to_file(os.path.join(staging_dir, file_name), first_chunk, chunks)
+                    metrics.inc("urlui_download_bytes_total", bytes_written, method="direct")
+                    span.set(bytes=bytes_written, streamed=False)
+                    print(f"Direct: Downloaded {bytes_written:,} bytes without a browser.")
+                    return False, file_path
+                _stream_csv_response(job, file_name, content_length, itertools.chain([first_chunk], chunks), span)
+                return True, None
+        except (requests.RequestException, OSError, ValueError) as e:
+            if span.attributes.get("streamed"):
+                raise
+            _direct_download_failed(target_url, span, e)
+            return False, None
+
+def _stream_csv_response(job, file_name, content_length, chunks, span):
+    span.set(streamed=True, file=file_name)
+    size_note = f" of {content_length:,}" if content_length else ""
+    print(f"Stream: Parsing '{file_name}' in batches of {STREAM_BATCH_ROWS:,} rows while it downloads...")
+    digest = hashlib.sha256()
+    progress = {"bytes": 0, "rows": 0, "batches": 0}
+    row_hashes = []
+    columns = []
+    archive = None
+    if ARCHIVE_ENABLED:
+        if _module_available("pyarrow"):
+            archive = ArchiveWriter(job["url"])
+        else:
+            print("Archive: pyarrow is not installed; snapshot NOT archived.")
+
+    def counted_chunks():
+        for chunk in chunks:
+            if chunk:
+                digest.update(chunk)
+                progress["bytes"] += len(chunk)
+                yield chunk
+
+    def parsed_batches():
+        nonlocal archive
+        for batch in iter_streamed_csv_batches(counted_chunks()):
+            progress["rows"] += batch.shape[0]
+            progress["batches"] += 1
+            columns[:] = list(batch.columns)
+            row_hashes.append(disclosure_row_hashes(batch).to_numpy())
+            metrics.inc("urlui_rows_parsed_total", batch.shape[0])
+            print(f"Stream: Batch {progress['batches']}: {batch.shape[0]} rows ({progress['rows']:,} total, {progress['bytes']:,}{size_note} bytes received).")
+            if archive is not None:
+                try:
+                    archive.write(batch)
+                except Exception as e_archive:
+                    print(f"⚠️ Archive: Could not archive snapshot: {type(e_archive).__name__}: {str(e_archive).splitlines()[0]}")
+                    archive.abort()
+                    archive = None
+            yield batch
+
+    try:
+        results = stream_to_sinks(parsed_batches(), job, job_sink_specs(job))
+    finally:
+        # Rows received before a failure are still archived; the archive deduplicates them next time.
+        if archive is not None:
+            try:
+                with Span("archive"):
+                    archive.close()
+            except Exception as e_archive:
+                print(f"⚠️ Archive: Could not archive snapshot: {type(e_archive).__name__}: {str(e_archive).splitlines()[0]}")
+    metrics.inc("urlui_download_bytes_total", progress["bytes"], method="stream")
+    span.set(bytes=progress["bytes"], rows=progress["rows"], batches=progress["batches"])
+    job["rows"] = progress["rows"]
+    job["file_hash"] = digest.hexdigest()
+    job["frame_hash"] = row_hashes_fingerprint(columns, np.concatenate(row_hashes) if row_hashes else np.array([], dtype="uint64"))
+    job["sink_results"] = results
+    failed = [result for result in results if not result["ok"]]
+    if failed:
+        print(f"Upload FAILED for {len(failed)} of {len(results)} sink(s) while streaming.")
+        job["error"] = "; ".join(f"{result['sink']}: {result['error']}" for result in failed)
+        span.fail(job["error"])
+        return
+    job["uploaded"] = True
+    job["ok"] = True
+    record_synced_fingerprint(job_target_key(job), job["file_hash"], job["frame_hash"], progress["rows"])
+    if len(results) > 1:
+        print("Sink: " + ", ".join(f"'{result['sink']}' {result['rows']} rows in {result['seconds']:.1f}s" for result in results))
+    print(f"---")
+    print(f"✅ Task COMPLETED for: {file_name} (streamed {progress['rows']:,} rows in {progress['batches']} batches, {progress['bytes']:,} bytes; nothing kept on disk)")
+
+# === Main Selenium and Processing Logic ===
+def download_via_browser(target_url, staging_dir):
+    pool = get_webdriver_pool()
+    pooled = None
+    suspect_driver = False
+    link_timeout = adaptive_timeouts.timeout_for(target_url, "download_link", PAGE_READY_TIMEOUT_SECONDS)
+    try:
+        print("Driver: Checking out a Chrome WebDriver from the pool...")
+        with Span("browser.driver_setup") as span:
+            try:
+                pooled = pool.acquire(staging_dir, timeout=WEBDRIVER_CHECKOUT_TIMEOUT)
+                driver = pooled.driver
+                span.set(use=pooled.uses + 1)
+                print(f"Driver: WebDriver is ready (running headlessly, use #{pooled.uses + 1}).")
+            except Exception as e_driver:
+                print(f"❌ Driver setup error: {e_driver}")
+                span.fail(f"Driver setup error: {e_driver}")
+                return None, f"Driver setup error: {e_driver}"
 
-# === Thread-Safe UI Update Helpers ===
-def _update_ui(page, task_logic_func, *args_for_task_logic):
-    def scheduled_task_wrapper():
-        if page and page.session_id:
+        navigate_timeout = adaptive_timeouts.timeout_for(target_url, "navigate", PAGE_READY_TIMEOUT_SECONDS)
+        print(f"Navigating to target URL (page load '{PAGE_LOAD_STRATEGY}', timeout {navigate_timeout:.0f}s)...")
+        with Span("browser.navigate", url=target_url, timeout=navigate_timeout) as span:
+            driver.set_page_load_timeout(navigate_timeout)
+            step_started = time.perf_counter()
             try:
-                task_logic_func(*args_for_task_logic)
-            except Exception as e:
-                original_stderr = getattr(sys, '__stderr__', sys.stderr)
-                print(f"Error during scheduled UI task execution: {e}", file=original_stderr)
-                traceback.print_exc(file=original_stderr)
-        else:
-            original_stdout = getattr(sys, '__stdout__', sys.stdout)
-            print("Debug (from _update_ui): UI update skipped, page closed before task execution.", file=original_stdout)
+                driver.get(target_url)
+                print("Navigation complete.")
+            except Exception as e_nav:
+                if not is_selenium_timeout(e_nav):
+                    raise
+                # The download link may already be usable; stop loading and let the link wait decide.
+                try:
+                    driver.execute_script("window.stop();")
+                except Exception:
+                    print("Driver: Browser did not respond to window.stop(); it will be recycled.")
+                    suspect_driver = True
+                    raise
+                span.set(stopped_loading=True)
+                print(f"Navigation still loading after {navigate_timeout:.0f}s; stopped the page load.")
+            adaptive_timeouts.record(target_url, "navigate", time.perf_counter() - step_started)
 
-    if page and page.session_id:
-        page.call_soon_threadsafe(scheduled_task_wrapper)
-    else:
-        original_stdout = getattr(sys, '__stdout__', sys.stdout)
-        print("Debug (from _update_ui): UI update skipped, page closed before queueing.", file=original_stdout)
+        print(f"Waiting for download button (ID: {DOWNLOAD_LINK_ID}, timeout {link_timeout:.0f}s)...")
+        with Span("browser.wait_download_link", timeout=link_timeout):
+            wait = WebDriverWait(driver, link_timeout, poll_frequency=PAGE_READY_POLL_INTERVAL)
+            step_started = time.perf_counter()
+            try:
+                download_btn_element = wait.until(EC.element_to_be_clickable((By.ID, DOWNLOAD_LINK_ID)))
+            finally:
+                adaptive_timeouts.record(target_url, "download_link", time.perf_counter() - step_started)
 
-def set_control_value(page, control, new_value):
-    def core_task():
-        control.value = new_value
-        if hasattr(control, 'update'): control.update()
-    _update_ui(page, core_task)
+        if USE_DIRECT_HTTP_DOWNLOAD:
+            # The rendered page and its session cookies usually let us skip the click entirely.
+            staged_file_path = direct_http_download(driver.current_url, staging_dir, driver.page_source, driver.get_cookies())
+            if staged_file_path:
+                return staged_file_path, None
 
-def set_control_disabled(page, control, is_disabled):
-    def core_task():
-        control.disabled = is_disabled
-        if hasattr(control, 'update'): control.update()
-    _update_ui(page, core_task)
+        timeout_seconds = adaptive_timeouts.timeout_for(target_url, "download", DOWNLOAD_TIMEOUT_SECONDS)
+        with Span("browser.download", timeout=timeout_seconds) as span, DownloadWatcher(staging_dir) as watcher:
+            print("Button found. Attempting to click download link...")
+            step_started = time.perf_counter()
+            driver.execute_script("arguments[0].click();", download_btn_element)
+            print(f"Download action triggered. Waiting for the file ({watcher.backend}, timeout {timeout_seconds:.0f}s)...")
+            staged_file_path = watcher.wait_for_file(timeout_seconds)
+            adaptive_timeouts.record(target_url, "download", time.perf_counter() - step_started)
+            if staged_file_path:
+                downloaded_bytes = os.path.getsize(staged_file_path)
+                metrics.inc("urlui_download_bytes_total", downloaded_bytes, method="browser")
+                span.set(bytes=downloaded_bytes, watcher=watcher.backend)
+            else:
+                span.fail(f"Download timed out after {timeout_seconds:.0f}s")
+        if staged_file_path:
+            return staged_file_path, None
 
-def append_text_to_control(page, control, new_log_entry, max_visible_lines=MAX_STATUS_LABEL_LINES):
-    def core_task():
-        new_lines_to_add = [line for line in new_log_entry.split('\n') if line.strip()]
-        current_text = control.value if control.value else ""
-        current_lines = [line for line in current_text.split('\n') if line.strip()]
-        current_lines.extend(new_lines_to_add)
-        if len(current_lines) > max_visible_lines:
-            current_lines = current_lines[-max_visible_lines:]
-        control.value = "\n".join(current_lines)
-        if hasattr(control, 'update'): control.update()
-    _update_ui(page, core_task)
+        print(f"---")
+        print(f"❌ File download timed out after {timeout_seconds:.0f} seconds.")
+        print(f"   Contents of staging directory '{staging_dir}': {os.listdir(staging_dir) if os.path.exists(staging_dir) else 'Directory not found or inaccessible'}")
+        return None, f"Download timed out after {timeout_seconds:.0f}s"
+    except Exception as e_task:
+        if is_selenium_timeout(e_task) and not suspect_driver:
+            print(f"❌ Download link '{DOWNLOAD_LINK_ID}' was not clickable within {link_timeout:.0f}s.")
+            return None, f"Download link not ready after {link_timeout:.0f}s"
+        suspect_driver = True
+        print(f"❌ Browser download error: {type(e_task).__name__}: {str(e_task).splitlines()[0]}")
+        return None, f"{type(e_task).__name__}: {str(e_task).splitlines()[0]}"
+    finally:
+        if pooled:
+            pool.release(pooled, suspect=suspect_driver)
+            stats = pool.stats()
+            print(f"Browser returned to pool (idle: {stats['idle']}, in use: {stats['in_use']}, created: {stats['created']}, recycled: {stats['recycled']}).")
 
-# === Class for Redirecting print() Output to Flet UI ===
-class RedirectOutput:
-    def __init__(self, page_ref, status_label_ref, max_lines_in_label=MAX_STATUS_LABEL_LINES):
-        self.page = page_ref
-        self.status_label = status_label_ref
-        self.max_lines = max_lines_in_label
-        self.buffer = ""
-        self.original_stdout = None
-        self.original_stderr = None
+def _finish_unchanged_download(downloaded_file_path, job):
+    try:
+        os.remove(downloaded_file_path)
+        print(f"   Duplicate local file '{os.path.basename(downloaded_file_path)}' was deleted.")
+    except OSError as e_del:
+        print(f"   Error deleting duplicate local file: {e_del}")
+    job["skipped"] = True
+    job["ok"] = True
+    print("--- Task COMPLETED (no new data) ---")
 
-    def write(self, text):
-        if not (self.page and self.page.session_id):
-            if self.original_stdout:
-                self.original_stdout.write(f"(UI Page Gone) {text}")
-            return
-        self.buffer += text
-        if '\n' in self.buffer:
-            lines_to_send, self.buffer = self.buffer.rsplit('\n', 1)
-            if lines_to_send:
-                append_text_to_control(self.page, self.status_label, lines_to_send, self.max_lines)
-            if self.buffer == '\n':
-                self.buffer = ""
+def new_disclosure_job(target_url, resolved_download_dir, sheet_id=None, worksheet_name=None, sinks=None):
+    sheet_id = sheet_id or GOOGLE_SHEET_ID
+    worksheet_name = worksheet_name or WORKSHEET_NAME
+    sinks = resolve_sink_specs(SINKS if sinks is None else sinks, sheet_id, worksheet_name)
+    return {"url": target_url, "download_dir": resolved_download_dir, "sheet_id": sheet_id, "worksheet": worksheet_name, "sinks": sinks,
+            "ok": False, "file": None, "rows": None, "uploaded": False, "skipped": False, "error": None,
+            "trace_id": uuid.uuid4().hex}
 
-    def flush(self):
-        if self.page and self.page.session_id and self.buffer:
-            append_text_to_control(self.page, self.status_label, self.buffer, self.max_lines)
-            self.buffer = ""
-        elif self.buffer and self.original_stdout:
-             self.original_stdout.write(f"(UI Page Gone - Flush) {self.buffer}")
-             self.buffer = ""
+def _sheet_configured(job):
+    return bool(job["sheet_id"] and job["sheet_id"] != 'YOUR_GOOGLE_SHEET_ID_HERE')
 
-    def __enter__(self):
-        self.original_stdout = sys.stdout
-        self.original_stderr = sys.stderr
-        sys.stdout = self
-        sys.stderr = self
-        return self
+def sinks_stream(sink_specs):
+    return bool(sink_specs) and all(build_sink(spec).streams for spec in sink_specs)
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.flush()
-        sys.stdout = self.original_stdout
-        sys.stderr = self.original_stderr
-        if exc_type:
-            error_message = f"ERROR in task: {exc_type.__name__}: {str(exc_val).splitlines()[0]}"
-            if self.page and self.page.session_id:
-                append_text_to_control(self.page, self.status_label, error_message, self.max_lines)
-            if self.original_stderr:
-                print(f"\n--- Worker Thread Exception (UI attempted for summary) ---", file=self.original_stderr)
-                traceback.print_exception(exc_type, exc_val, exc_tb, file=self.original_stderr)
-                print(f"--- End Worker Thread Exception ---", file=self.original_stderr)
+def job_sink_specs(job):
+    if job.get("sinks"):
+        return job["sinks"]
+    if _sheet_configured(job):
+        return [{"type": "sheet", "sheet_id": job["sheet_id"], "worksheet": job["worksheet"]}]
+    return []
 
-# === Google Sheets Functions ===
-def get_gspread_client():
-    creds = None
-    if os.path.exists(TOKEN_FILE):
-        print("GS: Loading token...")
-        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            print("GS: Refreshing token...")
-            try:
-                creds.refresh(Request())
-            except Exception as e:
-                print(f"GS: Token refresh error: {e}")
-                return None
-        else:
-            if not os.path.exists(CREDENTIALS_FILE):
-                print(f"GS ERROR: '{CREDENTIALS_FILE}' not found! Please place it in the script directory.")
-                return None
-            print("GS: Starting OAuth (check console/browser for prompt)...")
-            try:
-                flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
-                print("GS: Please follow the OAuth prompts that may appear in your browser or console.")
-                creds = flow.run_local_server(port=0)
-            except Exception as e:
-                print(f"GS: OAuth error: {e}")
-                return None
-        with open(TOKEN_FILE, 'w') as token:
-            token.write(creds.to_json())
-            print("GS: Token saved.")
-    print("GS: Authorizing client...")
+# Stage functions take and update a job dict; they return a falsy value when the job stops
+# there (error or unchanged data), so each one can also run as its own queue step.
+@traced_stage("download")
+def download_stage(job):
+    target_url = job["url"]
+    resolved_download_dir = job["download_dir"]
+    print(f"Process starting for URL: {target_url}")
+    print(f"Using download directory: {resolved_download_dir}")
     try:
-        client = gspread.authorize(creds)
-        print("GS: Client authorized.")
-        return client
-    except Exception as e:
-        print(f"GS: Client auth error: {e}")
-        return None
+        os.makedirs(resolved_download_dir, exist_ok=True)
+        print(f"Ensured download directory exists or was created: {resolved_download_dir}")
+    except OSError as e:
+        print(f"❌ Error creating download directory '{resolved_download_dir}': {e}")
+        job["error"] = f"Download directory error: {e}"
+        return False
 
-def upload_df_to_sheet(df, sheet_id_param, worksheet_name_param):
+    # Each download lands in its own staging directory so that the file can be tied to
+    # this task even when several tasks (or stale files) share the download directory.
+    staging_dir = os.path.join(resolved_download_dir, f".incoming-{uuid.uuid4().hex[:12]}")
     try:
-        print("GS: Connecting for upload...")
-        gc = get_gspread_client()
-        if not gc:
+        os.makedirs(staging_dir, exist_ok=True)
+        staged_file_path = None
+        if USE_DIRECT_HTTP_DOWNLOAD:
+            if STREAM_CSV_EXPORTS and sinks_stream(job_sink_specs(job)):
+                streamed, staged_file_path = stream_csv_export(job, staging_dir)
+                if streamed:
+                    return False
+            else:
+                staged_file_path = direct_http_download(target_url, staging_dir)
+            if not staged_file_path:
+                print("Direct: Falling back to the Chrome download path.")
+        if not staged_file_path:
+            staged_file_path, download_error = download_via_browser(target_url, staging_dir)
+            if not staged_file_path:
+                job["error"] = download_error
+                return False
+
+        downloaded_file_path = move_download_into(staged_file_path, resolved_download_dir)
+        job["file"] = downloaded_file_path
+        print(f"---")
+        print(f"✅ File download detected: {os.path.basename(downloaded_file_path)}")
+        print(f"   File saved to: {downloaded_file_path}")
+        sys.stdout.flush()
+
+        job["file_hash"] = file_sha256(downloaded_file_path)
+        last_synced = get_synced_fingerprint(job_target_key(job)) if SKIP_UNCHANGED_DOWNLOADS and job_sink_specs(job) else None
+        job["last_synced"] = last_synced
+        if last_synced and last_synced.get("file_sha256") == job["file_hash"]:
+            print(f"⏭️ Download is byte-identical to the last synced one ({last_synced.get('synced_at')}). Parse and upload SKIPPED.")
+            _finish_unchanged_download(downloaded_file_path, job)
             return False
-        spreadsheet = gc.open_by_key(sheet_id_param)
-        worksheet = None
-        try:
-            worksheet = spreadsheet.worksheet(worksheet_name_param)
-        except gspread.exceptions.WorksheetNotFound:
-            print(f"GS: Worksheet '{worksheet_name_param}' not found. Creating...")
+        return True
+    except Exception as e_task:
+        print(f"❌ UNEXPECTED ERROR in main task: {type(e_task).__name__}: {str(e_task).splitlines()[0]}")
+        job["error"] = f"{type(e_task).__name__}: {str(e_task).splitlines()[0]}"
+        return False
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+@traced_stage("parse")
+def parse_stage(job, read_file=None):
+    downloaded_file_path = job["file"]
+    base_name = os.path.basename(downloaded_file_path)
+    print(f"Reading '{base_name}' with Pandas...")
+    try:
+        df = (read_file or read_disclosure_file)(downloaded_file_path)
+        if df is None:
+            print(f"❌ Unsupported file type for processing: {base_name}")
+            job["error"] = f"Unsupported file type: {base_name}"
+            return None
+
+        job["rows"] = df.shape[0]
+        metrics.inc("urlui_rows_parsed_total", df.shape[0])
+        print(f"Successfully read data from '{base_name}'. Shape: {df.shape}.")
+        if ARCHIVE_ENABLED:
             try:
-                worksheet = spreadsheet.add_worksheet(title=worksheet_name_param, rows=max(100, df.shape[0]+10), cols=max(20, df.shape[1] + 5))
-            except Exception as e_create:
-                print(f"❌ GS: Create worksheet error: {e_create}")
+                with Span("archive"):
+                    archive_snapshot(df, job["url"])
+            except Exception as e_archive:
+                print(f"⚠️ Archive: Could not archive snapshot: {type(e_archive).__name__}: {str(e_archive).splitlines()[0]}")
+        job["frame_hash"] = frame_fingerprint(df)
+        last_synced = job.get("last_synced")
+        if last_synced and last_synced.get("frame_sha256") == job["frame_hash"]:
+            print(f"⏭️ Rows are identical to the last synced download ({last_synced.get('synced_at')}). Upload SKIPPED.")
+            record_synced_fingerprint(job_target_key(job), job["file_hash"], job["frame_hash"], df.shape[0])
+            _finish_unchanged_download(downloaded_file_path, job)
+            return None
+        return df
+    except Exception as e_proc:
+        print(f"❌ Error processing downloaded file '{base_name}': {str(e_proc).splitlines()[0]}")
+        job["error"] = f"Processing error: {str(e_proc).splitlines()[0]}"
+        return None
+
+@traced_stage("upload")
+def upload_stage(job, df):
+    downloaded_file_path = job["file"]
+    base_name = os.path.basename(downloaded_file_path)
+    sink_specs = job_sink_specs(job)
+    print(f"Preparing for upload to {len(sink_specs)} sink(s)..." if job.get("sinks") else "Preparing for Google Sheets upload...")
+    try:
+        if sink_specs:
+            results = write_to_sinks(df, job, sink_specs)
+            job["sink_results"] = results
+            failed = [result for result in results if not result["ok"]]
+            if failed:
+                print(f"Upload FAILED for {len(failed)} of {len(results)} sink(s). Local file retained: {downloaded_file_path}")
+                job["error"] = "; ".join(f"{result['sink']}: {result['error']}" for result in failed)
                 return False
-        print(f"GS: Clearing '{worksheet_name_param}'...")
-        worksheet.clear()
-        df_upload = df.fillna('')
-        print(f"GS: Uploading {df_upload.shape[0]} rows to '{worksheet_name_param}'...")
-        data_to_upload = [df_upload.columns.values.tolist()] + df_upload.values.tolist()
-        worksheet.update(data_to_upload, value_input_option='USER_ENTERED')
-        ws_id_url_part = f"#gid={worksheet.id}" if hasattr(worksheet, 'id') else ""
-        print(f"✅ GS: Uploaded! URL: {spreadsheet.url}{ws_id_url_part}")
-        return True
-    except Exception as e:
-        error_msg = f"❌ GS Upload Error: {type(e).__name__}: {str(e).splitlines()[0]}"
-        if isinstance(e, gspread.exceptions.APIError) and "PERMISSION_DENIED" in str(e):
-            error_msg += " Check sheet sharing."
-        print(error_msg)
-        original_stderr = getattr(sys, '__stderr__', sys.stderr)
-        if original_stderr:
-             print(f"Detailed Google Sheets Upload Error (Console):\n{traceback.format_exc()}", file=original_stderr)
+            job["uploaded"] = True
+            record_synced_fingerprint(job_target_key(job), job.get("file_hash"), job.get("frame_hash"), df.shape[0])
+            if len(results) > 1:
+                print("Sink: " + ", ".join(f"'{result['sink']}' {result['rows']} rows in {result['seconds']:.1f}s" for result in results))
+            print(f"Upload done. Deleting local file: {base_name}")
+            try:
+                os.remove(downloaded_file_path)
+                print(f"   Local file '{base_name}' was deleted.")
+            except Exception as e_del:
+                print(f"   Error deleting local file '{base_name}': {e_del}")
+        else:
+            print(f"⚠️ Google Sheet ID not configured. Upload SKIPPED.")
+            print(f"   File retained at: {downloaded_file_path}")
+    except Exception as e_upload:
+        print(f"❌ Error uploading '{base_name}': {type(e_upload).__name__}: {str(e_upload).splitlines()[0]}")
+        job["error"] = f"Upload error: {str(e_upload).splitlines()[0]}"
         return False
 
-# === Main Selenium and Processing Logic ===
-def run_downloader_and_uploader_task(target_url, resolved_download_dir, page_ref, status_label_ref, send_button_ref):
+    print(f"---")
+    print(f"✅ Task COMPLETED for: {base_name}")
+    print(f"   Downloaded to: {downloaded_file_path if os.path.exists(downloaded_file_path) else 'File was deleted after processing'}")
+    job["ok"] = True
+    return True
+
+def process_disclosure_url(target_url, resolved_download_dir, sheet_id=None, worksheet_name=None):
+    job = new_disclosure_job(target_url, resolved_download_dir, sheet_id, worksheet_name)
+    try:
+        with Span("task", job["trace_id"], url=target_url) as span:
+            df = parse_stage(job) if download_stage(job) else None
+            if df is not None:
+                upload_stage(job, df)
+            if job["error"]:
+                span.fail(job["error"])
+        return job
+    finally:
+        record_job_result(job)
+        print("--- Task execution finished ---")
+
+def run_downloader_and_uploader_task(target_url, resolved_download_dir, log_sink, page_ref, send_button_ref):
     set_control_disabled(page_ref, send_button_ref, True)
+    with log_sink.channel():
+        process_disclosure_url(target_url, resolved_download_dir)
+    set_control_disabled(page_ref, send_button_ref, False)
 
-    with RedirectOutput(page_ref, status_label_ref, MAX_STATUS_LABEL_LINES):
-        print(f"Process starting for URL: {target_url}")
-        print(f"Using download directory: {resolved_download_dir}")
-        try:
-            os.makedirs(resolved_download_dir, exist_ok=True)
-            print(f"Ensured download directory exists or was created: {resolved_download_dir}")
-        except OSError as e:
-            print(f"❌ Error creating download directory '{resolved_download_dir}': {e}")
-            set_control_disabled(page_ref, send_button_ref, False)
+# === Staged Pipeline ===
+def _read_disclosure_file_captured(file_path):
+    # Runs in a parse process; its log lines are handed back so they land in the job's channel.
+    captured = io.StringIO()
+    with contextlib.redirect_stdout(captured):
+        df = read_disclosure_file(file_path)
+    return df, captured.getvalue()
+
+class PipelineStage:
+    def __init__(self, name, workers, queue_size):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.inbox = Queue(maxsize=max(0, int(queue_size)))
+        self._lock = threading.Lock()
+        self.busy = 0
+        self.processed = 0
+        self.busy_seconds = 0.0
+        self.peak_queued = 0
+
+    def put(self, item):
+        self.inbox.put(item)
+        with self._lock:
+            self.peak_queued = max(self.peak_queued, self.inbox.qsize())
+
+    def begin(self):
+        with self._lock:
+            self.busy += 1
+        return time.perf_counter()
+
+    def end(self, started):
+        with self._lock:
+            self.busy -= 1
+            self.processed += 1
+            self.busy_seconds += time.perf_counter() - started
+
+    def stats(self, elapsed):
+        with self._lock:
+            return {"stage": self.name, "workers": self.workers, "busy": self.busy, "queued": self.inbox.qsize(),
+                    "peak_queued": self.peak_queued, "processed": self.processed,
+                    "per_second": self.processed / elapsed if elapsed > 0 else 0.0,
+                    "utilization": self.busy_seconds / (elapsed * self.workers) if elapsed > 0 else 0.0}
+
+class DisclosurePipeline:
+    # download -> parse -> upload, each stage with its own workers. The parse and upload inboxes are
+    # bounded, so a slow stage holds back the one before it instead of piling up parsed frames; the
+    # download inbox is not, so retries fed back into it can never deadlock the stages.
+    def __init__(self, download_workers=None, parse_workers=None, upload_workers=None, parse_processes=None,
+                 queue_size=None, task_timeout=BATCH_TASK_TIMEOUT, retries=BATCH_RETRIES, log_sink=None, on_outcome=None,
+                 keep_outcomes=True):
+        queue_size = PIPELINE_QUEUE_SIZE if queue_size is None else queue_size
+        self.stages = {
+            "download": PipelineStage("download", download_workers or PIPELINE_DOWNLOAD_WORKERS, 0),
+            "parse": PipelineStage("parse", parse_workers or PIPELINE_PARSE_WORKERS, queue_size),
+            "upload": PipelineStage("upload", upload_workers or PIPELINE_UPLOAD_WORKERS, queue_size),
+        }
+        self.parse_processes = PIPELINE_PARSE_PROCESSES if parse_processes is None else int(parse_processes)
+        self.task_timeout = task_timeout
+        self.retries = retries
+        self.log_sink = log_sink or ConsoleLogSink()
+        self.on_outcome = on_outcome
+        # Long-running callers (the daemon) consume outcomes through on_outcome and wait with
+        # wait_finished() instead, so finished jobs are not kept around.
+        self.keep_outcomes = keep_outcomes
+        self._finished_count = 0
+        self._finished_changed = threading.Condition()
+        self._handlers = {"download": self._download, "parse": self._parse, "upload": self._upload}
+        self._finished = Queue()
+        self._threads = []
+        self._process_pool = None
+        self._pool_lock = threading.Lock()
+        self._started = None
+
+    def start(self):
+        self._started = time.time()
+        if self.parse_processes > 0:
+            self._process_pool = ProcessPoolExecutor(max_workers=self.parse_processes, mp_context=multiprocessing.get_context("spawn"))
+        for name, stage in self.stages.items():
+            for n in range(stage.workers):
+                thread = threading.Thread(target=self._worker_loop, args=(stage, self._handlers[name]), name=f"pipeline-{name}-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def submit(self, index, entry, download_dir):
+        item = {"index": index, "entry": entry, "download_dir": download_dir, "attempt": 0, "started": time.time()}
+        self._start_attempt(item)
+
+    def _start_attempt(self, item):
+        entry = item["entry"]
+        item["attempt"] += 1
+        item["attempt_started"] = None
+        item["job"] = new_disclosure_job(entry["url"], item["download_dir"], entry.get("sheet_id"), entry.get("worksheet"), entry.get("sinks"))
+        item["df"] = None
+        self.stages["download"].put(item)
+
+    def _worker_loop(self, stage, handler):
+        while True:
+            item = stage.inbox.get()
+            if item is None:
+                break
+            started = stage.begin()
+            try:
+                with self.log_sink.channel(f"#{item['index']}"):
+                    try:
+                        handler(item)
+                    except Exception as e_stage:
+                        item["job"]["error"] = f"{type(e_stage).__name__}: {str(e_stage).splitlines()[0] if str(e_stage) else ''}"
+                        print(f"❌ UNEXPECTED ERROR in {stage.name} stage: {item['job']['error']}")
+                        try:
+                            self._finish(item)
+                        except Exception as e_finish:
+                            # The stage thread must survive; results() would otherwise wait for it forever.
+                            print(f"❌ UNEXPECTED ERROR finishing [{item['index']}]: {type(e_finish).__name__}: {e_finish}")
+            finally:
+                stage.end(started)
+
+    def _timed_out(self, item):
+        if time.time() - item["attempt_started"] <= self.task_timeout:
+            return False
+        job = item["job"]
+        job["error"] = f"Timed out after {self.task_timeout}s"
+        print(f"⚠️ Attempt {item['attempt']} timed out after {self.task_timeout}s. File retained at: {job.get('file') or '-'}")
+        self._finish(item)
+        return True
+
+    def _download(self, item):
+        # The attempt clock starts here so that time spent queued behind other URLs does not count.
+        item["attempt_started"] = time.time()
+        print(f"Batch [{item['index']}]: attempt {item['attempt']}/{self.retries + 1} for {item['entry']['url']}")
+        if not download_stage(item["job"]):
+            self._finish(item)
+        elif not self._timed_out(item):
+            self.stages["parse"].put(item)
+
+    def _parse(self, item):
+        if self._timed_out(item):
             return
+        item["df"] = parse_stage(item["job"], self._read_file)
+        if item["df"] is None:
+            self._finish(item)
+        else:
+            self.stages["upload"].put(item)
+
+    def _upload(self, item):
+        df, item["df"] = item["df"], None
+        if not self._timed_out(item):
+            upload_stage(item["job"], df)
+            self._finish(item)
 
-        chrome_options = Options()
-        chrome_options.add_experimental_option("prefs", {
-            "download.default_directory": resolved_download_dir,
-            "download.prompt_for_download": False,
-            "directory_upgrade": True,
-            "safebrowsing.enabled": True
-        })
-        chrome_options.add_argument("--headless=new")
-        chrome_options.add_argument("--disable-gpu")
-        chrome_options.add_argument("--window-size=1920,1080")
-        chrome_options.add_argument("--no-sandbox")
-        chrome_options.add_argument("--disable-dev-shm-usage")
-        chrome_options.add_argument('--log-level=3')
-        chrome_options.add_experimental_option('excludeSwitches', ['enable-logging'])
-        chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36")
-        chrome_options.add_argument("--disable-blink-features=AutomationControlled")
-
-        driver = None
-        downloaded_file_path = None # Initialize to ensure it's defined
+    def _read_file(self, file_path):
+        if self._process_pool is None or not file_path.lower().endswith((".xlsx", ".xls")):
+            return read_disclosure_file(file_path)
+        pool = self._process_pool
         try:
-            print("Driver: Setting up Chrome WebDriver...")
+            df, output = pool.submit(_read_disclosure_file_captured, file_path).result()
+        except BrokenProcessPool:
+            print("Parse: A parse process died; restarting the pool and parsing this file in-thread.")
+            with self._pool_lock:
+                # Several parse workers can hit the same broken pool; only the first one replaces it.
+                if self._process_pool is pool:
+                    self._process_pool = ProcessPoolExecutor(max_workers=self.parse_processes, mp_context=multiprocessing.get_context("spawn"))
+            pool.shutdown(wait=False)
+            return read_disclosure_file(file_path)
+        print(output, end='')
+        return df
+
+    def _finish(self, item):
+        job = item["job"]
+        print("--- Task execution finished ---")
+        if not job["ok"] and item["attempt"] <= self.retries:
+            print(f"Batch [{item['index']}]: attempt {item['attempt']} failed: {job['error']}")
+            metrics.inc("urlui_job_retries_total", runner="pipeline")
+            self._start_attempt(item)
+            return
+        outcome = {"index": item["index"], "url": item["entry"]["url"], "attempts": item["attempt"], "elapsed": time.time() - item["started"]}
+        outcome.update({key: job.get(key) for key in ("ok", "rows", "uploaded", "skipped", "file", "error")})
+        try:
+            record_job_result(job)
+            if self.on_outcome is not None:
+                self.on_outcome(outcome)
+        except Exception as e_report:
+            # The outcome is still counted below so that results() and wait_finished() return.
+            print(f"⚠️ Batch [{item['index']}]: could not report the outcome: {type(e_report).__name__}: {e_report}")
+        if self.keep_outcomes:
+            self._finished.put(outcome)
+        with self._finished_changed:
+            self._finished_count += 1
+            self._finished_changed.notify_all()
+
+    def results(self, expected):
+        outcomes = []
+        while len(outcomes) < expected:
             try:
-                os.environ['WDM_LOG_LEVEL'] = '0'
-                service = Service(ChromeDriverManager().install())
-                driver = webdriver.Chrome(service=service, options=chrome_options)
-                print("Driver: WebDriver is ready (running headlessly).")
-            except Exception as e_driver:
-                print(f"❌ Driver setup error: {e_driver}")
-                return
+                outcomes.append(self._finished.get(timeout=PIPELINE_STATS_INTERVAL))
+            except Empty:
+                self.log_sink.append(self.format_stats(), "pipeline")
+        return outcomes
 
-            wait = WebDriverWait(driver, 40)
-            print(f"Navigating to target URL...")
-            driver.get(target_url)
-            print("Navigation complete.")
+    def wait_finished(self, expected):
+        with self._finished_changed:
+            while self._finished_count < expected:
+                if not self._finished_changed.wait(timeout=PIPELINE_STATS_INTERVAL):
+                    self.log_sink.append(self.format_stats(), "pipeline")
 
-            download_button_id = "downloadlnk"
-            print(f"Waiting for download button (ID: {download_button_id})...")
-            download_btn_element = wait.until(EC.element_to_be_clickable((By.ID, download_button_id)))
+    def stats(self):
+        elapsed = time.time() - self._started if self._started else 0.0
+        return [stage.stats(elapsed) for stage in self.stages.values()]
 
-            print("Button found. Attempting to click download link...")
-            driver.execute_script("arguments[0].click();", download_btn_element)
-            print("Download action triggered. Monitoring download directory...")
-
-            timeout_seconds = 90
-            start_time = time.time()
-            # downloaded_file_path = None # Already initialized above
-            last_monitor_update_time = 0
-
-            while time.time() - start_time < timeout_seconds:
-                current_files = os.listdir(resolved_download_dir)
-                data_files = [f for f in current_files if (f.lower().endswith((".xlsx", ".xls", ".csv"))) and not f.lower().startswith("~$") and not f.lower().endswith((".tmp", ".crdownload"))]
-
-                if data_files:
-                    data_files.sort(key=lambda f_name: os.path.getmtime(os.path.join(resolved_download_dir, f_name)), reverse=True)
-                    potential_file = os.path.join(resolved_download_dir, data_files[0])
-                    time.sleep(3) # Give a bit of time for the file to be fully written
-                    if os.path.exists(potential_file) and os.path.getsize(potential_file) > 0:
-                        downloaded_file_path = potential_file
-                        break
-
-                current_time = time.time()
-                if current_time - last_monitor_update_time > 5 or last_monitor_update_time == 0 :
-                    elapsed_time = int(current_time - start_time)
-                    print(f"Monitoring download... ({elapsed_time}s / {timeout_seconds}s)")
-                    last_monitor_update_time = current_time
-                time.sleep(0.5)
-
-            if downloaded_file_path:
-                base_name = os.path.basename(downloaded_file_path)
-                print(f"---")
-                print(f"✅ File download detected: {base_name}")
-                print(f"   File saved to: {downloaded_file_path}") 
-                sys.stdout.flush() # <--- ADDED THIS LINE
-                print(f"Reading '{base_name}' with Pandas...")
-
-                df = None
-                try:
-                    if downloaded_file_path.lower().endswith((".xlsx", ".xls")):
-                        df = pd.read_excel(downloaded_file_path)
-                    elif downloaded_file_path.lower().endswith(".csv"):
-                        try:
-                            df = pd.read_csv(downloaded_file_path, encoding='utf-8')
-                        except UnicodeDecodeError:
-                            print("   CSV UTF-8 decoding failed, trying 'latin1'...")
-                            df = pd.read_csv(downloaded_file_path, encoding='latin1')
-
-                    if df is not None:
-                        print(f"Successfully read data from '{base_name}'. Shape: {df.shape}.")
-                        print(f"Preparing for Google Sheets upload...")
-
-                        if GOOGLE_SHEET_ID and GOOGLE_SHEET_ID != 'YOUR_GOOGLE_SHEET_ID_HERE':
-                            upload_successful = upload_df_to_sheet(df, GOOGLE_SHEET_ID, WORKSHEET_NAME)
-                            if upload_successful:
-                               print(f"Google Sheets upload done. Deleting local file: {base_name}")
-                               try:
-                                   os.remove(downloaded_file_path)
-                                   print(f"   Local file '{base_name}' was deleted.")
-                               except Exception as e_del:
-                                   print(f"   Error deleting local file '{base_name}': {e_del}")
-                            else:
-                               print(f"Google Sheets upload FAILED. Local file retained: {downloaded_file_path}")
-                        else:
-                            print(f"⚠️ Google Sheet ID not configured. Upload SKIPPED.")
-                            print(f"   File retained at: {downloaded_file_path}")
-
-                        print(f"---")
-                        print(f"✅ Task COMPLETED for: {base_name}")
-                        print(f"   Downloaded to: {downloaded_file_path if os.path.exists(downloaded_file_path) else 'File was deleted after processing'}")
-                    else:
-                        print(f"❌ Unsupported file type for processing: {base_name}")
-                except Exception as e_proc:
-                    print(f"❌ Error processing downloaded file '{base_name}': {str(e_proc).splitlines()[0]}")
+    def format_stats(self):
+        return "Pipeline: " + " | ".join(
+            f"{s['stage']} {s['busy']}/{s['workers']} busy, {s['queued']} queued, {s['processed']} done ({s['per_second']:.2f}/s)"
+            for s in self.stats())
+
+    def close(self):
+        for stage in self.stages.values():
+            for _ in range(stage.workers):
+                stage.inbox.put(None)
+            for thread in [t for t in self._threads if t.name.startswith(f"pipeline-{stage.name}-")]:
+                thread.join()
+        if self._process_pool is not None:
+            self._process_pool.shutdown()
+
+# === Batch Mode ===
+def parse_batch_fields(fields, where="batch"):
+    fields = [field.strip() for field in fields]
+    if not fields or not fields[0] or fields[0].startswith("#"):
+        return None
+    url = fields[0]
+    if not (url.startswith("http://") or url.startswith("https://")):
+        raise ValueError(f"{where}: invalid URL '{url}' (must start with http:// or https://)")
+    return {
+        "url": url,
+        "sheet_id": fields[1] if len(fields) > 1 and fields[1] else None,
+        "worksheet": fields[2] if len(fields) > 2 and fields[2] else None,
+    }
+
+def parse_batch_file(batch_file_path):
+    entries = []
+    with open(batch_file_path, newline='', encoding='utf-8-sig') as f:
+        for line_number, row in enumerate(csv.reader(f), start=1):
+            entry = parse_batch_fields(row, f"{batch_file_path}:{line_number}")
+            if entry:
+                entries.append(entry)
+    return entries
+
+def run_batch(entries, download_dir, concurrency=BATCH_CONCURRENCY, task_timeout=BATCH_TASK_TIMEOUT, retries=BATCH_RETRIES, log_sink=None,
+              parse_workers=None, upload_workers=None, parse_processes=None):
+    pipeline = DisclosurePipeline(concurrency, parse_workers, upload_workers, parse_processes,
+                                  task_timeout=task_timeout, retries=retries, log_sink=log_sink)
+    workers = "/".join(str(stage.workers) for stage in pipeline.stages.values())
+    print(f"Batch: {len(entries)} URL(s), download/parse/upload workers {workers}"
+          f"{f', {pipeline.parse_processes} parse process(es)' if pipeline.parse_processes > 0 else ''}, timeout {task_timeout}s, retries {retries}.")
+    get_webdriver_pool().ensure_size(pipeline.stages["download"].workers)
+    batch_started = time.time()
+    pipeline.start()
+    try:
+        for index, entry in enumerate(entries, start=1):
+            pipeline.submit(index, entry, download_dir)
+        outcomes = pipeline.results(len(entries))
+    finally:
+        pipeline.close()
+    outcomes.sort(key=lambda o: o["index"])
+    print_batch_summary(outcomes, time.time() - batch_started, pipeline.stats())
+    return outcomes
+
+def format_batch_outcome(o):
+    status = "OK  " if o["ok"] else "FAIL"
+    rows = o["rows"] if o["rows"] is not None else "-"
+    detail = "uploaded" if o["uploaded"] else ("unchanged, skipped" if o.get("skipped") else (o["error"] or "not uploaded"))
+    return f"{status} [{o['index']}] {o['url']} | attempts: {o['attempts']} | {o['elapsed']:.1f}s | rows: {rows} | {detail}"
+
+def print_batch_summary(outcomes, total_elapsed, stage_stats=()):
+    succeeded = sum(1 for o in outcomes if o["ok"])
+    print(f"=== Batch summary: {succeeded}/{len(outcomes)} succeeded in {total_elapsed:.1f}s ===")
+    for o in outcomes:
+        print(format_batch_outcome(o))
+    for s in stage_stats:
+        print(f"Stage {s['stage']}: {s['processed']} step(s), {s['per_second']:.2f}/s, {s['utilization']:.0%} busy "
+              f"across {s['workers']} worker(s), peak queue {s['peak_queued']}")
+
+def run_batch_task(batch_file_path, resolved_download_dir, log_sink, page_ref, buttons):
+    for button in buttons:
+        set_control_disabled(page_ref, button, True)
+    with log_sink.channel("batch"):
+        try:
+            entries = parse_batch_file(batch_file_path)
+        except (OSError, ValueError) as e:
+            print(f"❌ Could not read batch file: {e}")
+            entries = []
+        if entries:
+            run_batch(entries, resolved_download_dir, log_sink=log_sink)
+        else:
+            print("Batch: No URLs to process.")
+    for button in buttons:
+        set_control_disabled(page_ref, button, False)
+
+# === Scheduled Polling Service ===
+class CronSchedule:
+    # Standard 5-field cron: minute hour day-of-month month day-of-week (0 or 7 = Sunday).
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression '{expression}' must have 5 fields")
+        self.expression = expression
+        self.minutes = self._parse_field(fields[0], 0, 59)
+        self.hours = self._parse_field(fields[1], 0, 23)
+        self.days = self._parse_field(fields[2], 1, 31)
+        self.months = self._parse_field(fields[3], 1, 12)
+        self.weekdays = {day % 7 for day in self._parse_field(fields[4], 0, 7)}
+        self.day_restricted = fields[2] != "*"
+        self.weekday_restricted = fields[4] != "*"
+
+    @staticmethod
+    def _parse_field(field, low, high):
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_text = part.split("/", 1)
+                step = int(step_text)
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(value) for value in part.split("-", 1))
             else:
-                print(f"---")
-                print(f"❌ File download timed out after {timeout_seconds} seconds.")
-                print(f"   Contents of download directory '{resolved_download_dir}': {os.listdir(resolved_download_dir) if os.path.exists(resolved_download_dir) else 'Directory not found or inaccessible'}")
+                start = int(part)
+                end = high if step != 1 else start
+            if step < 1 or start < low or end > high or start > end:
+                raise ValueError(f"cron field '{field}' is outside {low}-{high}")
+            values.update(range(start, end + 1, step))
+        return values
 
-        except Exception as e_task:
-            print(f"❌ UNEXPECTED ERROR in main task: {type(e_task).__name__}: {str(e_task).splitlines()[0]}")
-        finally:
-            if driver:
-                driver.quit()
-                print("Browser (headless) has been closed.")
-            print("--- Task execution finished ---")
+    def _day_matches(self, moment):
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.day_restricted and self.weekday_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
 
-    set_control_disabled(page_ref, send_button_ref, False)
+    def next_after(self, moment):
+        candidate = moment.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        give_up_year = moment.year + 5
+        while candidate.year <= give_up_year:
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1, hour=0, minute=0) + datetime.timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + datetime.timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + datetime.timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += datetime.timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"cron expression '{self.expression}' never matches")
+
+def load_poll_schedule(schedule_path):
+    with open(schedule_path, encoding='utf-8') as f:
+        raw_entries = json.load(f)
+    schedules = []
+    for position, raw in enumerate(raw_entries, start=1):
+        entry = parse_batch_fields([raw.get("url", ""), raw.get("sheet_id") or "", raw.get("worksheet") or ""], f"{schedule_path} entry {position}")
+        if entry is None:
+            raise ValueError(f"{schedule_path} entry {position}: missing 'url'")
+        if bool(raw.get("cron")) == bool(raw.get("every")):
+            raise ValueError(f"{schedule_path} entry {position}: give exactly one of 'cron' or 'every' (seconds)")
+        entry["name"] = raw.get("name") or entry["url"]
+        entry["download_dir"] = raw.get("download_dir")
+        entry["sinks"] = raw.get("sinks")
+        for spec in entry["sinks"] or []:
+            build_sink(spec)
+        entry["cron"] = CronSchedule(raw["cron"]) if raw.get("cron") else None
+        entry["every"] = float(raw["every"]) if raw.get("every") else None
+        schedules.append(entry)
+    return schedules
+
+def _next_due(schedule, after_timestamp):
+    if schedule["every"]:
+        return after_timestamp + schedule["every"]
+    return schedule["cron"].next_after(datetime.datetime.fromtimestamp(after_timestamp)).timestamp()
+
+class JobQueue:
+    # Jobs advance download -> parse -> upload; each stage is its own claimable step, so a
+    # restart resumes at the first stage that had not finished.
+    def __init__(self, db_path=None):
+        self.db_path = db_path or JOB_QUEUE_DB
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    sheet_id TEXT NOT NULL DEFAULT '',
+                    worksheet TEXT NOT NULL DEFAULT '',
+                    stage TEXT NOT NULL DEFAULT 'download',
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_run_at REAL NOT NULL,
+                    payload TEXT NOT NULL DEFAULT '{}',
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS jobs_one_active_per_target
+                    ON jobs (url, sheet_id, worksheet) WHERE status IN ('queued', 'running');
+                CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, next_run_at);
+                CREATE TABLE IF NOT EXISTS schedules (
+                    name TEXT PRIMARY KEY,
+                    next_due_at REAL NOT NULL
+                );
+            """)
+
+    def enqueue(self, job):
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (url, sheet_id, worksheet, next_run_at, payload, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job["url"], job["sheet_id"] or '', job["worksheet"] or '', now, json.dumps(job), now, now))
+            return cursor.lastrowid if cursor.rowcount else None
+
+    def recover(self):
+        with self._lock:
+            cursor = self._conn.execute("UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'", (time.time(),))
+            return cursor.rowcount
+
+    def claim(self):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' AND next_run_at <= ? ORDER BY next_run_at, id LIMIT 1", (now,)).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? WHERE id = ?", (now, row["id"]))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        claimed = dict(row, status='running')
+        claimed["attempts"] += 1
+        claimed["payload"] = json.loads(claimed["payload"])
+        return claimed
+
+    def _update(self, job_id, **columns):
+        columns["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in columns)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*columns.values(), job_id))
+
+    def advance(self, job_id, next_stage, payload):
+        self._update(job_id, stage=next_stage, status='queued', attempts=0, next_run_at=time.time(),
+                     payload=json.dumps(payload), last_error=None)
+
+    def complete(self, job_id, payload):
+        self._update(job_id, status='done', payload=json.dumps(payload), last_error=None)
+
+    def retry_or_fail(self, claimed, error, payload=None):
+        payload = json.dumps(payload if payload is not None else claimed["payload"])
+        if claimed["attempts"] >= JOB_MAX_ATTEMPTS:
+            self._update(claimed["id"], status='failed', last_error=error, payload=payload)
+            return None
+        delay = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * 2 ** (claimed["attempts"] - 1)) * random.uniform(0.8, 1.2)
+        self._update(claimed["id"], status='queued', last_error=error, payload=payload, next_run_at=time.time() + delay)
+        return delay
+
+    def schedule_due_at(self, name):
+        with self._lock:
+            row = self._conn.execute("SELECT next_due_at FROM schedules WHERE name = ?", (name,)).fetchone()
+        return row["next_due_at"] if row else None
+
+    def set_schedule_due_at(self, name, due_at):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO schedules (name, next_due_at) VALUES (?, ?)", (name, due_at))
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, stage, COUNT(*) AS n FROM jobs GROUP BY status, stage").fetchall()
+        return {f"{row['status']}/{row['stage']}": row["n"] for row in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def run_queued_job_step(queue, claimed):
+    job = claimed["payload"]
+    job["error"] = None
+    stage = claimed["stage"]
+    print(f"Queue: Job {claimed['id']} stage '{stage}', attempt {claimed['attempts']}/{JOB_MAX_ATTEMPTS}: {job['url']}")
+    next_stage = None
+    if stage == "download":
+        if download_stage(job):
+            next_stage = "parse"
+    elif stage == "parse":
+        if not job.get("file") or not os.path.exists(job["file"]):
+            print("Queue: Downloaded file is gone; restarting from the download stage.")
+            queue.advance(claimed["id"], "download", new_disclosure_job(job["url"], job["download_dir"], job["sheet_id"], job["worksheet"], job.get("sinks")))
+            return
+        df = parse_stage(job)
+        if df is not None:
+            os.makedirs(JOB_FRAMES_DIR, exist_ok=True)
+            job["frame_path"] = os.path.join(JOB_FRAMES_DIR, f"job-{claimed['id']}.pkl")
+            df.to_pickle(job["frame_path"])
+            next_stage = "upload"
+    elif stage == "upload":
+        df = pd.read_pickle(job["frame_path"])
+        if upload_stage(job, df):
+            os.remove(job["frame_path"])
+    else:
+        job["error"] = f"Unknown stage '{stage}'"
+
+    if next_stage:
+        queue.advance(claimed["id"], next_stage, job)
+    elif job["ok"]:
+        queue.complete(claimed["id"], job)
+        record_job_result(job)
+        print(f"Queue: Job {claimed['id']} done{' (unchanged, skipped)' if job.get('skipped') else ''}.")
+    else:
+        retry_or_fail_queued_job(queue, claimed, job)
+
+def retry_or_fail_queued_job(queue, claimed, job):
+    stage = claimed["stage"]
+    delay = queue.retry_or_fail(claimed, job["error"] or "unknown error", job)
+    if delay is None:
+        record_job_result(job)
+        print(f"Queue: ❌ Job {claimed['id']} FAILED at stage '{stage}' after {claimed['attempts']} attempts: {job['error']}")
+        if job.get("frame_path") and os.path.exists(job["frame_path"]):
+            os.remove(job["frame_path"])
+    else:
+        metrics.inc("urlui_job_retries_total", runner="queue")
+        print(f"Queue: Job {claimed['id']} stage '{stage}' failed ({job['error']}); retrying in {delay:.0f}s.")
+
+def _queue_worker_loop(queue, stop_event, log_sink):
+    while not stop_event.is_set():
+        claimed = queue.claim()
+        if claimed is None:
+            stop_event.wait(SCHEDULER_TICK_SECONDS)
+            continue
+        with log_sink.channel(f"job {claimed['id']}"):
+            try:
+                run_queued_job_step(queue, claimed)
+            except Exception as e_step:
+                error = f"{type(e_step).__name__}: {str(e_step).splitlines()[0] if str(e_step) else ''}"
+                print(f"Queue: ❌ UNEXPECTED ERROR in stage '{claimed['stage']}': {error}")
+                job = claimed["payload"]
+                job["error"] = error
+                retry_or_fail_queued_job(queue, claimed, job)
+
+def run_scheduler(schedule_path, download_dir, workers=BATCH_CONCURRENCY, stop_event=None, log_sink=None):
+    schedules = load_poll_schedule(schedule_path)
+    queue = JobQueue()
+    stop_event = stop_event or threading.Event()
+    log_sink = log_sink or ConsoleLogSink()
+    recovered = queue.recover()
+    print(f"Scheduler: {len(schedules)} schedule(s), {workers} worker(s), queue '{queue.db_path}'"
+          f"{f', resumed {recovered} interrupted job(s)' if recovered else ''}.")
+    get_webdriver_pool().ensure_size(workers)
+
+    worker_threads = [threading.Thread(target=_queue_worker_loop, args=(queue, stop_event, log_sink), name=f"queue-worker-{n}", daemon=True)
+                      for n in range(workers)]
+    for thread in worker_threads:
+        thread.start()
+    try:
+        while not stop_event.is_set():
+            now = time.time()
+            for schedule in schedules:
+                due_at = queue.schedule_due_at(schedule["name"])
+                if due_at is None:
+                    due_at = now if schedule["every"] else _next_due(schedule, now)
+                    queue.set_schedule_due_at(schedule["name"], due_at)
+                if due_at > now:
+                    continue
+                job = new_disclosure_job(schedule["url"], schedule["download_dir"] or download_dir, schedule["sheet_id"], schedule["worksheet"], schedule["sinks"])
+                job_id = queue.enqueue(job)
+                if job_id:
+                    print(f"Scheduler: Queued job {job_id} for '{schedule['name']}'.")
+                else:
+                    print(f"Scheduler: '{schedule['name']}' is still queued or running; this run is skipped.")
+                next_due = _next_due(schedule, now)
+                queue.set_schedule_due_at(schedule["name"], next_due)
+                print(f"Scheduler: Next run of '{schedule['name']}' at {datetime.datetime.fromtimestamp(next_due):%Y-%m-%d %H:%M:%S}.")
+            stop_event.wait(SCHEDULER_TICK_SECONDS)
+    except KeyboardInterrupt:
+        print("Scheduler: Stopping; running steps will finish or resume on the next start...")
+    finally:
+        stop_event.set()
+        for thread in worker_threads:
+            thread.join(timeout=DOWNLOAD_TIMEOUT_SECONDS)
+        print(f"Scheduler: Queue status: {queue.stats()}")
+        queue.close()
 
 # === Flet Application Main Function ===
-def main(page: ft.Page):
+def main(page: "ft.Page"):
     page.title = "BSE Data Processor"
     page.theme_mode = ft.ThemeMode.LIGHT
     page.vertical_alignment = ft.MainAxisAlignment.START
@@ -382,6 +3340,7 @@ def main(page: ft.Page):
         selectable=True,
         font_family="monospace"
     )
+    log_sink = StatusLogSink(page, status_label)
 
     send_button = ft.ElevatedButton(
         text="Download & Upload",
@@ -390,11 +3349,36 @@ def main(page: ft.Page):
         height=50
     )
 
+    batch_file_textfield = ft.TextField(
+        label="Batch file (one URL per line, optionally followed by ,sheet_id,worksheet)",
+        hint_text="e.g., D:\\My BSE Downloads\\urls.txt",
+        expand=True
+    )
+
+    batch_button = ft.ElevatedButton(
+        text="Run Batch",
+        icon="playlist_play_rounded",
+        width=150,
+        height=50
+    )
+
+    def resolve_download_dir():
+        if default_location_checkbox.value:
+            if custom_location_textfield.error_text:
+                 custom_location_textfield.error_text = None
+                 custom_location_textfield.update()
+            return USER_SPECIFIED_DEFAULT_DOWNLOAD_PATH
+        actual_download_dir = custom_location_textfield.value.strip()
+        if not actual_download_dir:
+            custom_location_textfield.error_text = "Custom location cannot be empty if default is unchecked."
+        else:
+            custom_location_textfield.error_text = None
+        custom_location_textfield.update()
+        return actual_download_dir or None
+
     def send_button_clicked(e):
         entered_url = url_textfield.value.strip()
         url_valid = True
-        download_path_valid = True
-        actual_download_dir = ""
 
         if not entered_url:
             url_textfield.error_text = "URL cannot be empty."
@@ -406,19 +3390,8 @@ def main(page: ft.Page):
             url_textfield.error_text = None
         url_textfield.update()
 
-        if default_location_checkbox.value:
-            actual_download_dir = USER_SPECIFIED_DEFAULT_DOWNLOAD_PATH
-            if custom_location_textfield.error_text:
-                 custom_location_textfield.error_text = None
-                 custom_location_textfield.update()
-        else:
-            actual_download_dir = custom_location_textfield.value.strip()
-            if not actual_download_dir:
-                custom_location_textfield.error_text = "Custom location cannot be empty if default is unchecked."
-                download_path_valid = False
-            else:
-                custom_location_textfield.error_text = None
-            custom_location_textfield.update()
+        actual_download_dir = resolve_download_dir()
+        download_path_valid = actual_download_dir is not None
 
         if not url_valid or not download_path_valid:
             error_messages = []
@@ -429,22 +3402,45 @@ def main(page: ft.Page):
             
             status_error_message = "Error: " + " | ".join(msg for msg in error_messages if msg)
             if not status_error_message.endswith("Error: "):
-                 set_control_value(page, status_label, status_error_message)
+                 log_sink.set_text(status_error_message)
             else:
-                 set_control_value(page, status_label, "Error: Please correct the highlighted fields.")
+                 log_sink.set_text("Error: Please correct the highlighted fields.")
             return
 
-        set_control_value(page, status_label, f"Initiating process for: {entered_url}\nDownload path: {actual_download_dir}\n---")
+        log_sink.set_text(f"Initiating process for: {entered_url}\nDownload path: {actual_download_dir}\n---")
 
         thread = threading.Thread(
             target=run_downloader_and_uploader_task,
-            args=(entered_url, actual_download_dir, page, status_label, send_button)
+            args=(entered_url, actual_download_dir, log_sink, page, send_button)
+        )
+        thread.daemon = True
+        thread.start()
+
+    def batch_button_clicked(e):
+        batch_file_path = batch_file_textfield.value.strip()
+        if not batch_file_path or not os.path.isfile(batch_file_path):
+            batch_file_textfield.error_text = "Batch file not found."
+        else:
+            batch_file_textfield.error_text = None
+        batch_file_textfield.update()
+
+        actual_download_dir = resolve_download_dir()
+        if batch_file_textfield.error_text or actual_download_dir is None:
+            log_sink.set_text("Error: Please correct the highlighted fields.")
+            return
+
+        log_sink.set_text(f"Initiating batch from: {batch_file_path}\nDownload path: {actual_download_dir}\n---")
+
+        thread = threading.Thread(
+            target=run_batch_task,
+            args=(batch_file_path, actual_download_dir, log_sink, page, [send_button, batch_button])
         )
         thread.daemon = True
         thread.start()
 
     send_button.on_click = send_button_clicked
     url_textfield.on_submit = send_button_clicked
+    batch_button.on_click = batch_button_clicked
 
     page.add(
         ft.Column(
@@ -461,6 +3457,9 @@ def main(page: ft.Page):
                     controls=[custom_location_textfield],
                 ),
                 send_button,
+                ft.Row(
+                    controls=[batch_file_textfield, batch_button],
+                ),
                 ft.Divider(height=15, color=ft.Colors.BLACK26),
                
             ],
@@ -473,18 +3472,193 @@ def main(page: ft.Page):
     )
     toggle_custom_location_field(None) # Set initial visibility
 
+def parse_cli_args(argv=None):
+    parser = argparse.ArgumentParser(description="Download BSE India disclosures and upload them to Google Sheets.")
+    parser.add_argument("--url", help="Process a single disclosure URL headlessly instead of opening the UI.")
+    parser.add_argument("--sheet-id", help="Google Sheet ID for --url (default: GOOGLE_SHEET_ID).")
+    parser.add_argument("--worksheet", help="Worksheet name for --url (default: WORKSHEET_NAME).")
+    parser.add_argument("--batch", metavar="FILE", help="Process the URLs listed in FILE headlessly instead of opening the UI.")
+    parser.add_argument("--daemon", action="store_true", help="Keep running and process url[,sheet_id[,worksheet]] lines read from stdin.")
+    parser.add_argument("--schedule", metavar="FILE", help="Run the polling service for the URLs and cron/interval schedules in the JSON FILE.")
+    parser.add_argument("--queue-status", action="store_true", help="Print the job counts of the durable queue and exit.")
+    parser.add_argument("--sinks", metavar="FILE", help="Write every download to the sinks (sheets, CSV, Parquet) listed in this JSON file.")
+    parser.add_argument("--download-dir", default=USER_SPECIFIED_DEFAULT_DOWNLOAD_PATH, help="Directory for downloaded files.")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Number of URLs downloaded at the same time.")
+    parser.add_argument("--parse-workers", type=int, default=PIPELINE_PARSE_WORKERS, help="Number of downloads parsed at the same time.")
+    parser.add_argument("--upload-workers", type=int, default=PIPELINE_UPLOAD_WORKERS, help="Number of uploads to Google Sheets at the same time.")
+    parser.add_argument("--parse-processes", type=int, default=PIPELINE_PARSE_PROCESSES, help="Parse Excel files in this many worker processes (0 = in threads).")
+    parser.add_argument("--timeout", type=float, default=BATCH_TASK_TIMEOUT, help="Seconds per attempt, counted from when a download worker picks the URL up. "
+                        "Checked between stages: a result that arrives later is discarded and the URL retried; "
+                        "a stage itself is only cut off by its own HTTP/browser timeouts.")
+    parser.add_argument("--retries", type=int, default=BATCH_RETRIES, help="Extra attempts for a failed or timed out URL.")
+    parser.add_argument("--trace-file", help="Append one JSON line per timed step (span) to this file.")
+    parser.add_argument("--metrics-file", help="Keep Prometheus-format metrics in this file, rewritten after every job.")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on http://HOST:PORT/metrics.")
+    parser.add_argument("--metrics-host", help=f"Interface for --metrics-port (default {METRICS_HOST}; use 0.0.0.0 to allow remote scrapes).")
+    parser.add_argument("--profile-startup", action="store_true", help="Report the import time of each module (after the run, or on its own).")
+    parser.add_argument("--query-archive", action="store_true", help="Query the local Parquet archive instead of downloading.")
+    parser.add_argument("--security", help="Archive query: security code or part of the security name.")
+    parser.add_argument("--person", help="Archive query: part of the person's name.")
+    parser.add_argument("--since", help="Archive query: first snapshot date (YYYY-MM-DD).")
+    parser.add_argument("--until", help="Archive query: last snapshot date (YYYY-MM-DD).")
+    parser.add_argument("--source-url", help="Archive query: only rows downloaded from this URL.")
+    parser.add_argument("--out", help="Archive query: write the result to this CSV file instead of printing it.")
+    return parser.parse_args(argv)
+
+def print_startup_profile(load_everything):
+    if load_everything:
+        for lazy_import in _LAZY_IMPORTS:
+            try:
+                lazy_import._resolve()
+            except ImportError as e:
+                print(f"Startup: {lazy_import._module_name} is not installed ({e}).")
+    print(f"=== Startup profile ===")
+    print(f"{'urlui (module body, stdlib only)':<45} {_MODULE_IMPORT_SECONDS * 1000:9.1f} ms")
+    for module_name, seconds in sorted(IMPORT_TIMINGS.items(), key=lambda item: item[1], reverse=True):
+        print(f"{module_name:<45} {seconds * 1000:9.1f} ms")
+    print(f"{'total lazily imported':<45} {sum(IMPORT_TIMINGS.values()) * 1000:9.1f} ms")
+
+def run_url_cli(args):
+    entry = {"url": args.url, "sheet_id": args.sheet_id, "worksheet": args.worksheet}
+    pipeline = DisclosurePipeline(1, 1, 1, args.parse_processes, task_timeout=args.timeout, retries=args.retries).start()
+    try:
+        pipeline.submit(1, entry, args.download_dir)
+        outcome = pipeline.results(1)[0]
+    finally:
+        pipeline.close()
+    print(format_batch_outcome(outcome))
+    return 0 if outcome["ok"] else 1
+
+def run_batch_cli(args):
+    try:
+        entries = parse_batch_file(args.batch)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not read batch file: {e}")
+        return 2
+    if not entries:
+        print("Batch: No URLs to process.")
+        return 0
+    outcomes = run_batch(entries, args.download_dir, args.concurrency, args.timeout, args.retries, ConsoleLogSink(),
+                         args.parse_workers, args.upload_workers, args.parse_processes)
+    return 0 if all(o["ok"] for o in outcomes) else 1
+
+def run_daemon_cli(args):
+    log_sink = ConsoleLogSink()
+    print(f"Daemon: Waiting for url[,sheet_id[,worksheet]] lines on stdin (concurrency {args.concurrency}); EOF stops the daemon.")
+    get_webdriver_pool().ensure_size(args.concurrency)
+
+    failures = 0
+    failures_lock = threading.Lock()
+
+    def report(outcome):
+        nonlocal failures
+        log_sink.append(format_batch_outcome(outcome), "daemon")
+        if not outcome["ok"]:
+            with failures_lock:
+                failures += 1
+
+    pipeline = DisclosurePipeline(args.concurrency, args.parse_workers, args.upload_workers, args.parse_processes,
+                                  task_timeout=args.timeout, retries=args.retries, log_sink=log_sink, on_outcome=report,
+                                  keep_outcomes=False).start()
+    index = 0
+    try:
+        for line in sys.stdin:
+            try:
+                entry = parse_batch_fields(next(csv.reader([line]), []), "stdin")
+            except ValueError as e:
+                print(f"Daemon: {e}")
+                continue
+            if not entry:
+                continue
+            index += 1
+            pipeline.submit(index, entry, args.download_dir)
+        pipeline.wait_finished(index)
+    finally:
+        pipeline.close()
+    print(f"Daemon: stdin closed after {index} job(s), {failures} failed.")
+    return 0 if not failures else 1
+
+def run_archive_query_cli(args):
+    started = time.perf_counter()
+    df = query_archive(security=args.security, person=args.person, start_date=args.since, end_date=args.until, source_url=args.source_url)
+    print(f"Archive: {df.shape[0]} matching rows in {(time.perf_counter() - started) * 1000:.0f} ms.")
+    if args.out:
+        df.to_csv(args.out, index=False)
+        print(f"Archive: Results written to {args.out}")
+    elif not df.empty:
+        print(df.to_string(index=False, max_rows=50))
+    return 0
+
+def run_schedule_cli(args):
+    try:
+        run_scheduler(args.schedule, args.download_dir, args.concurrency)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not start the scheduler: {e}")
+        return 2
+    return 0
+
+def apply_observability_args(args):
+    global TRACE_FILE, METRICS_FILE
+    TRACE_FILE = args.trace_file or TRACE_FILE
+    METRICS_FILE = args.metrics_file or METRICS_FILE
+    metrics_port = args.metrics_port if args.metrics_port is not None else METRICS_PORT
+    if metrics_port is not None:
+        start_metrics_server(metrics_port, args.metrics_host)
+    if METRICS_FILE:
+        atexit.register(export_metrics)
+
+def run_headless_cli(args):
+    global SINKS
+    if args.sinks:
+        try:
+            SINKS = load_sink_specs(args.sinks)
+        except (OSError, ValueError) as e:
+            print(f"❌ Could not read sinks file: {e}")
+            return 2
+    if args.query_archive:
+        return run_archive_query_cli(args)
+    if args.queue_status:
+        queue = JobQueue()
+        print(f"Queue '{queue.db_path}': {queue.stats()}")
+        queue.close()
+        return 0
+    if args.schedule:
+        return run_schedule_cli(args)
+    if args.url:
+        return run_url_cli(args)
+    if args.batch:
+        return run_batch_cli(args)
+    if args.daemon:
+        return run_daemon_cli(args)
+    return None
+
+_MODULE_IMPORT_SECONDS = time.perf_counter() - _MODULE_IMPORT_STARTED
+
 if __name__ == "__main__":
-    if GOOGLE_SHEET_ID == 'YOUR_GOOGLE_SHEET_ID_HERE':
+    cli_args = parse_cli_args()
+    apply_observability_args(cli_args)
+    headless = bool(cli_args.query_archive or cli_args.queue_status or cli_args.schedule or cli_args.url or cli_args.batch or cli_args.daemon)
+    if cli_args.profile_startup and not headless:
+        print_startup_profile(load_everything=True)
+        sys.exit(0)
+
+    if GOOGLE_SHEET_ID == 'YOUR_GOOGLE_SHEET_ID_HERE' and not (cli_args.query_archive or cli_args.queue_status):
         print("\n--- ⚠️ CRITICAL SETUP WARNING (CONSOLE) ⚠️ ---")
         print("The GOOGLE_SHEET_ID is not set. Upload to Google Sheets will be SKIPPED.")
         print("Ensure 'credentials.json' is also present if GS upload is needed.")
         print("---------------------------------------------\n")
 
-    if not os.path.exists(CREDENTIALS_FILE):
+    if not os.path.exists(CREDENTIALS_FILE) and not (cli_args.query_archive or cli_args.queue_status):
         print("\n--- SETUP WARNING (CONSOLE) ---")
         print(f"Google API credentials file ('{CREDENTIALS_FILE}') not found in script directory.")
         print("OAuth for Google Sheets may fail if this file is required by the GSheets functions.")
         print("----------------------------\n")
     
+    if headless:
+        exit_code = run_headless_cli(cli_args)
+        if cli_args.profile_startup:
+            print_startup_profile(load_everything=False)
+        sys.exit(exit_code)
+
     print(f"User specified default download path: {USER_SPECIFIED_DEFAULT_DOWNLOAD_PATH}")
-    ft.app(target=main)
\ No newline at end of file
+    ft.app(target=main)